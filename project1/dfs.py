@@ -10,6 +10,7 @@ check the following code against a possible *unique* error.
 
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.search import GraphSearch, LifoFrontier, searchStart
 
 
 def key(state):
@@ -75,31 +76,23 @@ def dfs(state):
     -------
     - A list of legal moves as defined in `game.Directions`.
     """
-    path = []
-    fringe = [(state, path)]
-    closed = set()
-    prev_n_food = 0
+    return DepthFirstSearch().search(searchStart(state))
 
-    while True:
-        if len(fringe) == 0:
-            return []  # failure
 
-        current, path = fringe.pop()
-
-        if current.isWin():
-            return path
-
-        current_key = key(current)
-
-        n_food = current.getNumFood()
-
-        if n_food < prev_n_food:
-            closed.clear()
-
-        if current_key not in closed:
-            closed.add(current_key)
+class DepthFirstSearch(GraphSearch):
+    """
+    Depth-first search on Pacman's position, whose closed set is emptied
+    whenever Pacman eats a food dot, so that he can walk back through
+    the positions visited before.
+    """
 
-            for next_state, action in current.generatePacmanSuccessors():
-                fringe.append((next_state, path + [action]))
+    def __init__(self):
+        super().__init__(LifoFrontier(), key, pruneClosed=False)
+        self.prev_n_food = 0
 
-        prev_n_food = n_food
+    def close(self, node):
+        n_food = node.state.getNumFood()
+        if n_food < self.prev_n_food:
+            self.closed.clear()
+        self.prev_n_food = n_food
+        return super().close(node)
@@ -14,6 +14,9 @@
 
 from .util import manhattanDistance
 from .game import Grid
+from .game import BitGrid
+from .game import Actions
+from .game import Directions
 import os
 import random
 from functools import reduce
@@ -30,13 +33,14 @@ class Layout:
         self.width = len(layoutText[0])
         self.height = len(layoutText)
         self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.food = BitGrid(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.initializeActionTables()
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -75,6 +79,70 @@ class Layout:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(
                 str.__add__, self.layoutText)]
 
+    def initializeActionTables(self):
+        """
+        Precomputes the moves available on every free cell, so that the game
+        rules do not have to look at the walls on each call.
+
+        - legalActions[(x, y)]: the actions of Actions.getPossibleActions,
+          STOP included.
+        - neighbors[(x, y)]: (action, cell) pairs for the non-STOP moves.
+        - ghostActions[((x, y), direction)]: the moves left to a ghost that
+          arrived with that direction, i.e. without STOP and without turning
+          around unless it reached a dead end.
+        """
+        self.legalActions = {}
+        self.neighbors = {}
+        self.ghostActions = {}
+        for x in range(self.width):
+            for y in range(self.height):
+                if self.walls[x][y]:
+                    continue
+                actions = []
+                neighbors = []
+                for action, (dx, dy) in Actions._directionsAsList:
+                    nextx, nexty = x + dx, y + dy
+                    if 0 <= nextx < self.width and 0 <= nexty < self.height \
+                            and not self.walls[nextx][nexty]:
+                        actions.append(action)
+                        if action != Directions.STOP:
+                            neighbors.append((action, (nextx, nexty)))
+                self.legalActions[(x, y)] = tuple(actions)
+                self.neighbors[(x, y)] = tuple(neighbors)
+                for direction in Directions.REVERSE:
+                    self.ghostActions[((x, y), direction)] = tuple(
+                        self._ghostFilter(actions, direction))
+
+    def _ghostFilter(self, actions, direction):
+        actions = [a for a in actions if a != Directions.STOP]
+        reverse = Actions.reverseDirection(direction)
+        if reverse in actions and len(actions) > 1:
+            actions.remove(reverse)
+        return actions
+
+    def getLegalActions(self, configuration):
+        """
+        Returns the same list as Actions.getPossibleActions(configuration,
+        walls), read from the precomputed table when possible.
+        """
+        actions = self.legalActions.get(configuration.pos)
+        if actions is None:
+            return Actions.getPossibleActions(configuration, self.walls)
+        return list(actions)
+
+    def getGhostActions(self, configuration):
+        """
+        Returns the legal moves of a ghost: no stopping and no turning
+        around unless it reached a dead end.
+        """
+        actions = self.ghostActions.get(
+            (configuration.pos, configuration.direction))
+        if actions is None:
+            return self._ghostFilter(
+                Actions.getPossibleActions(configuration, self.walls),
+                configuration.direction)
+        return list(actions)
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -117,7 +185,11 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        """
+        Layouts are never modified once loaded, so game states share a
+        single instance rather than re-parsing the layout text.
+        """
+        return self
 
     def processLayoutText(self, layoutText):
         """
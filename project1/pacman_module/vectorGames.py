@@ -0,0 +1,307 @@
+# vectorGames.py
+# --------------
+# Lockstep simulation of many independent games with NumPy arrays.
+
+import numpy as np
+
+from .game import Actions
+from .game import Configuration
+from .game import Directions
+from .pacman import GameState
+from .pacman import getRulesProfile
+from .pacman import TIME_PENALTY
+
+# Action indices, in the order of Actions._directionsAsList
+ACTIONS = [direction for direction, _ in Actions._directionsAsList]
+NORTH, SOUTH, EAST, WEST, STOP = [
+    ACTIONS.index(d) for d in (Directions.NORTH, Directions.SOUTH,
+                               Directions.EAST, Directions.WEST,
+                               Directions.STOP)]
+VECTORS = np.array([vector for _, vector in Actions._directionsAsList],
+                   dtype=int)
+REVERSE = np.array([ACTIONS.index(Directions.REVERSE[d]) for d in ACTIONS])
+
+# Position of the ghosts once eaten, as in GhostRules.placeGhost
+VOID = -10
+
+# Action of the agents of finished games in the move history
+NO_ACTION = -1
+
+
+def randomPacmanPolicy(games, legal):
+    """
+    Moves Pacman uniformly at random, never stopping if he can move.
+    """
+    moves = legal.copy()
+    moves[:, STOP] &= ~moves[:, :STOP].any(axis=1)
+    return games.sample(moves.astype(float))
+
+
+def stopPacmanPolicy(games, legal):
+    """
+    Keeps Pacman still.
+    """
+    return np.full(len(legal), STOP)
+
+
+class VectorizedGames:
+    """
+    N independent games on the same layout, whose agents move in lockstep.
+
+    The positions, directions, food and scores of all the games are stored
+    as arrays, and every call to step() plays one round (Pacman then each
+    ghost) of every unfinished game under the rules of PacmanRules,
+    GhostRules and BeliefGhostRules:
+
+    - Pacman loses TIME_PENALTY points per move, earns 10 points per food
+      dot and 500 points when the last one is eaten;
+    - ghosts never stop and, unless `beliefTracking` is set, never turn
+      around except at dead ends;
+    - Pacman loses 500 points when he meets a ghost (`edibleGhosts` is
+      kept for compatibility with project III, where ghosts can be eaten).
+
+    Capsules are not supported, since scared ghosts move at half speed in
+    between the cells of the grid.
+
+    The mazes of project I have no ghosts, so GHOST_POLICIES is empty and
+    the games are played without ghosts (`ghostPolicy` None). Pacman
+    follows `pacmanPolicy`, a function mapping the games and the (N, 5)
+    mask of Pacman's legal actions to the (N,) indices of the chosen
+    actions.
+    The random draws come from a NumPy generator rather than from the
+    `random` module, so that a game is not move for move the same as one
+    played by Game.run. checkAgainstEngine() replays the recorded moves of
+    a game on GameState and checks that both engines agree.
+    """
+
+    def __init__(self, layout, numGames, ghostPolicy=None,
+                 numGhosts=0, pacmanPolicy=randomPacmanPolicy,
+                 beliefTracking=False, edibleGhosts=False, seed=None):
+        if layout.capsules:
+            raise ValueError("Layouts with capsules are not supported")
+        if edibleGhosts:
+            raise ValueError("Ghosts are never edible in this project")
+        if ghostPolicy is not None and ghostPolicy not in GHOST_POLICIES:
+            raise ValueError("Unknown ghost policy " + str(ghostPolicy))
+        if ghostPolicy is None and numGhosts > 0:
+            raise ValueError("Ghosts need a ghost policy")
+
+        self.layout = layout
+        self.numGames = numGames
+        self.ghostPolicy = GHOST_POLICIES.get(ghostPolicy)
+        self.pacmanPolicy = pacmanPolicy
+        self.beliefTracking = beliefTracking
+        self.edibleGhosts = edibleGhosts
+        self.random = np.random.default_rng(seed)
+        self._initializeLegalMasks()
+
+        ghostStarts = [pos for agtType, pos in layout.agentPositions
+                       if agtType != 0][:numGhosts]
+        self.numGhosts = len(ghostStarts)
+        self.numAgents = self.numGhosts + 1
+
+        # Agent 0 is Pacman, agents 1 to numGhosts are the ghosts
+        x = np.empty((numGames, self.numAgents), dtype=int)
+        y = np.empty((numGames, self.numAgents), dtype=int)
+        x[:, 0], y[:, 0] = layout.pacPos
+        if beliefTracking:
+            # Each game draws its own ghost positions, as in
+            # Layout.getRandomLegalGhostPosition
+            cells = np.argwhere(self.candidateCells)
+            picks = self.random.integers(
+                len(cells), size=(numGames, self.numGhosts))
+            x[:, 1:], y[:, 1:] = cells[picks, 0], cells[picks, 1]
+        else:
+            for index, (gx, gy) in enumerate(ghostStarts):
+                x[:, index + 1], y[:, index + 1] = gx, gy
+        self.startX, self.startY = x.copy(), y.copy()
+        self.x, self.y = x, y
+        self.direction = np.full((numGames, self.numAgents), STOP)
+        self.eaten = np.zeros((numGames, self.numAgents), dtype=bool)
+
+        food = np.array(layout.food.data, dtype=bool)
+        self.food = np.repeat(food[None], numGames, axis=0)
+        self.numFood = np.full(numGames, food.sum())
+        self.score = np.zeros(numGames)
+        self.win = np.zeros(numGames, dtype=bool)
+        self.lose = np.zeros(numGames, dtype=bool)
+        self.numRounds = 0
+        self.history = []
+
+    def _initializeLegalMasks(self):
+        layout = self.layout
+        self.legal = np.zeros(
+            (layout.width, layout.height, len(ACTIONS)), dtype=bool)
+        for (x, y), actions in layout.legalActions.items():
+            for action in actions:
+                self.legal[x, y, ACTIONS.index(action)] = True
+        walls = np.array(layout.walls.data, dtype=bool)
+        self.candidateCells = ~walls
+        self.candidateCells[-1, :] = False
+        self.candidateCells[:, -1] = False
+        self.candidateCells[layout.pacPos] = False
+
+    def isOver(self):
+        return self.win | self.lose
+
+    def sample(self, weights):
+        """
+        Draws one index per row of the (N, k) array of `weights`.
+        """
+        cumulative = np.cumsum(weights, axis=1)
+        draws = self.random.random(len(weights)) * cumulative[:, -1]
+        return (cumulative <= draws[:, None]).sum(axis=1)
+
+    def getPacmanLegalMask(self, games):
+        return self.legal[self.x[games, 0], self.y[games, 0]]
+
+    def getGhostLegalMask(self, games, index):
+        """
+        Returns the (len(games), 5) mask of the moves of ghost `index`,
+        as given by GhostRules (or BeliefGhostRules) without STOP.
+        """
+        legal = self.legal[self.x[games, index], self.y[games, index]].copy()
+        legal[:, STOP] = False
+        if not self.beliefTracking:
+            reverse = REVERSE[self.direction[games, index]]
+            rows = np.arange(len(games))
+            turns = (legal[rows, reverse] & (legal.sum(axis=1) > 1)
+                     & (reverse != STOP))
+            legal[rows[turns], reverse[turns]] = False
+        return legal
+
+    def step(self):
+        """
+        Plays one round of every unfinished game.
+        """
+        actions = np.full((self.numGames, self.numAgents), NO_ACTION)
+        for index in range(self.numAgents):
+            games = np.flatnonzero(~self.isOver())
+            if len(games) == 0:
+                break
+            if index == 0:
+                action = self.pacmanPolicy(
+                    self, self.getPacmanLegalMask(games))
+                self._move(games, 0, action)
+                self._eatFood(games)
+            else:
+                action = np.full(len(games), STOP)
+                moving = ~self.eaten[games, index]
+                if moving.any():
+                    movers = games[moving]
+                    action[moving] = self.ghostPolicy(
+                        self, movers, index,
+                        self.getGhostLegalMask(movers, index))
+                    self._move(movers, index, action[moving])
+            actions[games, index] = action
+            self._checkDeath(games, index)
+        self.history.append(actions)
+        self.numRounds += 1
+
+    def run(self, maxRounds):
+        """
+        Plays until every game is over or `maxRounds` rounds were played.
+        """
+        while self.numRounds < maxRounds and not self.isOver().all():
+            self.step()
+
+    def _move(self, games, index, action):
+        self.x[games, index] += VECTORS[action, 0]
+        self.y[games, index] += VECTORS[action, 1]
+        # Stopping keeps the current direction, see
+        # Configuration.generateSuccessor
+        moved = action != STOP
+        self.direction[games[moved], index] = action[moved]
+
+    def _eatFood(self, games):
+        self.score[games] -= TIME_PENALTY
+        x, y = self.x[games, 0], self.y[games, 0]
+        eats = self.food[games, x, y]
+        eaters = games[eats]
+        self.food[eaters, x[eats], y[eats]] = False
+        self.numFood[eaters] -= 1
+        self.score[eaters] += 10
+        cleared = eaters[(self.numFood[eaters] == 0) & ~self.lose[eaters]]
+        self.score[cleared] += 500
+        self.win[cleared] = True
+
+    def _checkDeath(self, games, agentIndex):
+        indices = range(1, self.numAgents) if agentIndex == 0 \
+            else [agentIndex]
+        for index in indices:
+            meets = ((self.x[games, index] == self.x[games, 0])
+                     & (self.y[games, index] == self.y[games, 0]))
+            met = games[meets]
+            if self.edibleGhosts:
+                self.score[met] += 200
+                self.x[met, index] = self.y[met, index] = VOID
+                self.eaten[met, index] = True
+                allEaten = met[self.eaten[met, 1:].all(axis=1)
+                               & ~self.lose[met]]
+                self.score[allEaten] += 500
+                self.win[allEaten] = True
+            else:
+                caught = met[~self.win[met]]
+                self.score[caught] -= 500
+                self.lose[caught] = True
+
+    def initialGameState(self, game):
+        """
+        Returns the GameState of the start of game number `game`.
+        """
+        state = GameState()
+        state.initialize(
+            self.layout, self.numGhosts,
+            beliefStateAgent=object() if self.beliefTracking else None,
+            profile=getRulesProfile(self.numAgents - 1, self.beliefTracking))
+        for index in range(1, self.numAgents):
+            agentState = state.data.agentStates[index]
+            agentState.start = Configuration(
+                (int(self.startX[game, index]),
+                 int(self.startY[game, index])), Directions.STOP)
+            agentState.configuration = agentState.start
+        state.data.rehash()
+        return state
+
+    def replay(self, game):
+        """
+        Returns the GameState reached by playing the recorded moves of game
+        number `game`, and the number of moves played.
+        """
+        state = self.initialGameState(game)
+        moves = 0
+        for actions in self.history:
+            for index in range(self.numAgents):
+                action = actions[game, index]
+                if action == NO_ACTION:
+                    break
+                state = state.generateSuccessor(index, ACTIONS[action])
+                moves += 1
+            if actions[game, 0] == NO_ACTION:
+                break
+        return state, moves
+
+    def checkAgainstEngine(self, game):
+        """
+        Replays the moves of game number `game` on GameState and raises an
+        exception if the two engines disagree on its current state.
+        Returns the number of moves checked.
+        """
+        state, moves = self.replay(game)
+
+        positions = [(int(self.x[game, index]), int(self.y[game, index]))
+                     for index in range(self.numAgents)]
+        expected = (positions, float(self.score[game]),
+                    bool(self.win[game]), bool(self.lose[game]))
+        found = ([state.data.agentStates[index].getPosition()
+                  for index in range(self.numAgents)],
+                 float(state.getScore()), state.isWin(), state.isLose())
+        if expected != found:
+            raise Exception(
+                "Game %d diverges from GameState: %s instead of %s"
+                % (game, expected, found))
+        return moves
+
+
+# No ghosts in the mazes of project I
+GHOST_POLICIES = {}
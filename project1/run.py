@@ -2,7 +2,8 @@ import imp
 import os
 from argparse import ArgumentParser, ArgumentTypeError
 
-from pacman_module.pacman import runGame
+from pacman_module.foodHeuristics import HEURISTICS
+from pacman_module.pacman import runGame, GameState
 from pacman_module.ghostAgents import\
     GreedyGhost, SmartyGhost, DumbyGhost, EastRandyGhost
 
@@ -68,7 +69,8 @@ ghosts["smarty"] = SmartyGhost
 ghosts["dumby"] = DumbyGhost
 ghosts["rightrandy"] = EastRandyGhost
 
-if __name__ == '__main__':
+
+def build_parser():
     usage = """
     USAGE:      python run.py <game_options> <agent_options>
     EXAMPLES:   (1) python run.py
@@ -106,6 +108,11 @@ if __name__ == '__main__':
         '--silentdisplay',
         help="Disable the graphical display of the game.",
         action="store_true")
+    parser.add_argument(
+        '--heuristic',
+        help='Heuristic of the A* agent: the mean Manhattan distance to '
+             'the food, or a maze distance bound.',
+        choices=["mean"] + sorted(HEURISTICS), default="mean")
     # Specific to Project III
     parser.add_argument(
         '--bsagentfile',
@@ -119,12 +126,19 @@ if __name__ == '__main__':
         '--p',
         help='Parameter p as specified in instructions for Project Part 3.',
         type=float, default=0.5)
+    parser.add_argument(
+        '--trackexplored',
+        help='Keep up to this many generated states and report their '
+             'memory footprint (instrumentation, off by default).',
+        type=positive_integer, default=None)
+    return parser
 
-    args = parser.parse_args()
 
-    if (args.agentfile == "humanagent.py" and args.silentdisplay):
-        print("Human agent cannot play without graphical display")
-        exit()
+def play(args):
+    """
+    Plays the game described by the command-line arguments `args` and
+    returns its total score, computation time and expanded nodes.
+    """
     agent = load_agent_from_file(args.agentfile, "PacmanAgent")(args)
 
     gagt = ghosts[args.ghostagent]
@@ -139,12 +153,28 @@ if __name__ == '__main__':
         bsagt = load_agent_from_file(
             args.bsagentfile, "BeliefStateAgent")(args)
 
-    total_score, total_computation_time, total_expanded_nodes = runGame(
+    return runGame(
         layout, agent, gagts, bsagt, not args.silentdisplay,
         expout=0, hiddenGhosts=args.hiddenghosts)
 
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if (args.agentfile == "humanagent.py" and args.silentdisplay):
+        print("Human agent cannot play without graphical display")
+        exit()
+
+    if args.trackexplored:
+        GameState.trackExplored(args.trackexplored)
+
+    total_score, total_computation_time, total_expanded_nodes = play(args)
+
     print("Total score : " + str(total_score))
     print("Total computation time (seconds) : " + str(total_computation_time))
+    if args.trackexplored:
+        print("Explored states : " + GameState.getExploredReport())
     print("Total expanded nodes : " + str(total_expanded_nodes))
     f = open("temp", "w+")
     s, c, e = total_score, total_computation_time, total_expanded_nodes
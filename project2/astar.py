@@ -1,6 +1,8 @@
+from pacman_module.foodHeuristics import HEURISTICS
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
-from pacman_module.util import PriorityQueue
+from pacman_module.search import GraphSearch, PackedKey, PriorityFrontier, \
+    searchStart
 from pacman_module.util import manhattanDistance
 
 
@@ -27,7 +29,7 @@ def h(state):
     return result / len(food_list)
 
 
-def g(backward_cost, num_food):
+def g(backward_cost, state):
     """
     Returns the value of the backward cost for the current state.
     Arguments:
@@ -39,7 +41,27 @@ def g(backward_cost, num_food):
     - A positive value representing the backward cost. The current backward
     cost is the previous backward cost + the current number of food
     """
-    return backward_cost + num_food
+    return backward_cost + state.getNumFood()
+
+
+def food_cost_heuristic(moves_bound):
+    """
+    Returns an admissible and consistent heuristic of the backward cost `g`
+    from a lower bound of the number of moves needed to eat all the food.
+    Arguments:
+    ----------
+    - `moves_bound`: a consistent lower bound of the number of moves, from
+                     `foodHeuristics.HEURISTICS`.
+    Return:
+    -------
+    - A function of a state. Each move costs the food left after it, at
+    least 1 until the last move, and eats at most one food dot: with F dots
+    and at least M moves left, the cost is at least F(F-1)/2 + max(M-F, 0).
+    """
+    def heuristic(state):
+        food = state.getNumFood()
+        return food * (food - 1) / 2 + max(moves_bound(state) - food, 0)
+    return heuristic
 
 
 class PacmanAgent(Agent):
@@ -57,7 +79,7 @@ class PacmanAgent(Agent):
         self.args = args
         self.moves = []
         self.food_list = []
-        self.init_food_list = []
+        self.packed_key = None
 
     def key(self, state):
         """
@@ -68,11 +90,10 @@ class PacmanAgent(Agent):
                    `pacman.GameState`.
         Return:
         -------
-        - A hashable key object that uniquely identifies a Pacman game state.
+        - A hashable key object that uniquely identifies a Pacman game state:
+        an integer packing Pacman's position and the remaining food.
         """
-        return tuple(state.getPacmanPosition()) + tuple(
-            [(1 if state.hasFood(food[0], food[1]) else 0)
-             for food in self.init_food_list])
+        return self.packed_key(state)
 
     def get_action(self, state):
         """
@@ -111,35 +132,14 @@ class PacmanAgent(Agent):
         -------
         - A list of legal moves as defined in `game.Directions`.
         """
-        self.init_food_list = state.getFood().asList()
-        fringe = PriorityQueue()
-        fringe.push((state, [], 0), 0)
-        closed = set()
-
-        while True:
-            # Failure case
-            if fringe.isEmpty() == 1:
-                return []
-
-            # Take the node with the lowest priority of the fringe
-            priority, (current, path, backward_cost) = fringe.pop()
-
-            # Win case
-            if current.isWin():
-                return path
-
-            # Take the key of the current state
-            current_key = self.key(current)
-
-            if current_key not in closed:
-                closed.add(current_key)
-
-                for next_state, action in current.generatePacmanSuccessors():
-                    next_key = self.key(next_state)
-                    if next_key not in closed:
-                        next_path = path + [action]
-                        next_backward_cost = g(backward_cost,
-                                               next_state.getNumFood())
-                        next_priority = h(next_state) + next_backward_cost
-                        fringe.push((next_state, next_path,
-                                     next_backward_cost), next_priority)
+        # Without ghosts, the search runs on positions and food only
+        start = searchStart(state)
+        self.packed_key = PackedKey(start)
+        name = getattr(self.args, "heuristic", "mean")
+        if name == "mean":
+            heuristic = h
+        else:
+            heuristic = food_cost_heuristic(
+                HEURISTICS[name](state.data.layout))
+        return GraphSearch(PriorityFrontier(), self.key, g, heuristic,
+                           childKey=self.packed_key.child).search(start)
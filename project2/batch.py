@@ -0,0 +1,155 @@
+import csv
+import io
+import itertools
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import numpy as np
+
+from run import build_parser, play, layout_thin_borders
+
+# Result columns, after the swept parameters
+RESULT_FIELDS = ["score", "computation_time", "expanded_nodes"]
+
+
+def make_configurations(agentfiles, ghostagents, layouts, seeds):
+    """
+    Given:
+    -------
+    - `agentfiles`, `ghostagents`, `layouts`, `seeds`: the values swept
+      for each parameter.
+
+    Return:
+    -------
+    - A list of dictionaries, one per game of the grid, mapping the
+      names of the parameters to their values.
+    """
+    return [dict(agentfile=a, ghostagent=g, layout=l, seed=s)
+            for a, g, l, s in itertools.product(
+                agentfiles, ghostagents, layouts, seeds)]
+
+
+def play_configuration(job):
+    """
+    Plays one game of a batch in a worker process.
+
+    Arguments:
+    ----------
+    - `job`: pair of the base command-line arguments and of the
+      configuration overriding them.
+
+    Return:
+    -------
+    - The configuration, completed with the results of the game.
+    """
+    base, configuration = job
+    args = Namespace(**vars(base))
+    for key, value in configuration.items():
+        setattr(args, key, value)
+
+    # Seed every game, so that a game does not depend on the worker
+    # nor on the games played before it
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    with redirect_stdout(io.StringIO()):
+        score, computation_time, expanded_nodes = play(args)
+
+    result = dict(configuration)
+    result.update(score=score, computation_time=computation_time,
+                  expanded_nodes=expanded_nodes)
+    return result
+
+
+def run_batch(base, configurations, processes=None):
+    """
+    Plays all the games of `configurations` in a pool of `processes`
+    worker processes (one per core by default).
+
+    Arguments:
+    ----------
+    - `base`: command-line arguments of `run.py` shared by all games.
+    - `configurations`: list of dictionaries of arguments overriding
+      `base`, see `make_configurations`.
+
+    Return:
+    -------
+    - The list of results, in the order of `configurations`.
+    """
+    base = Namespace(**vars(base))
+    base.silentdisplay = True
+
+    # Thicken the borders once, rather than in concurrent workers
+    configurations = [dict(c) for c in configurations]
+    for configuration in configurations:
+        layout = configuration.get("layout", base.layout)
+        configuration["layout"] = layout_thin_borders(layout, base.w)
+    base.w = 1
+
+    jobs = [(base, configuration) for configuration in configurations]
+    with Pool(processes) as pool:
+        return list(pool.imap(play_configuration, jobs, chunksize=1))
+
+
+def write_results(results, f):
+    if not results:
+        return
+    fields = [key for key in results[0] if key not in RESULT_FIELDS]
+    writer = csv.DictWriter(f, fieldnames=fields + RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python batch.py <sweep_options> <game_options>
+    EXAMPLES:   (1) python batch.py --agentfiles minimax.py hminimax0.py
+                        --ghostagents dumby greedy smarty --seeds 1 2 3
+                    - plays the 18 games of the grid on all cores
+                      and prints their results as CSV
+
+    Game options are those of run.py and are shared by all games.
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        '--agentfiles',
+        help='Python files containing a `PacmanAgent` class.',
+        nargs='+', default=["hminimax0.py"])
+    parser.add_argument(
+        '--ghostagents',
+        help='Ghost agents available in the `ghostAgents` module.',
+        nargs='+', choices=["dumby", "greedy", "smarty", "rightrandy"],
+        default=["greedy"])
+    parser.add_argument(
+        '--layouts',
+        help='Maze layouts (from layout folder).',
+        nargs='+', default=["small_adv"])
+    parser.add_argument(
+        '--seeds',
+        help='Seeds for the random number generators, one game per seed.',
+        nargs='+', type=int, default=[1])
+    parser.add_argument(
+        '--processes',
+        help='Number of worker processes (default: number of cores).',
+        type=int, default=None)
+    parser.add_argument(
+        '--output',
+        help='CSV file receiving the results (default: standard output).',
+        default=None)
+
+    args, game_argv = parser.parse_known_args()
+    base = build_parser().parse_args(game_argv)
+
+    configurations = make_configurations(
+        args.agentfiles, args.ghostagents, args.layouts, args.seeds)
+    results = run_batch(base, configurations, args.processes)
+
+    if args.output is None:
+        write_results(results, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            write_results(results, f)
@@ -1,6 +1,7 @@
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
-from pacman_module.util import PriorityQueue
+from pacman_module.search import GraphSearch, PackedKey, PriorityFrontier, \
+    searchStart
 from pacman_module.util import manhattanDistance
 
 
@@ -19,7 +20,7 @@ def h(state):
     return 0
 
 
-def g(backward_cost, num_food):
+def g(backward_cost, state):
     """
     Returns the value of the backward cost for the current state.
     Arguments:
@@ -49,7 +50,7 @@ class PacmanAgent(Agent):
         self.args = args
         self.moves = []
         self.food_list = []
-        self.init_food_list = []
+        self.packed_key = None
 
     def key(self, state):
         """
@@ -60,11 +61,10 @@ class PacmanAgent(Agent):
                    `pacman.GameState`.
         Return:
         -------
-        - A hashable key object that uniquely identifies a Pacman game state.
+        - A hashable key object that uniquely identifies a Pacman game state:
+        an integer packing Pacman's position and the remaining food.
         """
-        return tuple(state.getPacmanPosition()) + tuple(
-            [(1 if state.hasFood(
-                food[0], food[1]) else 0) for food in self.init_food_list])
+        return self.packed_key(state)
 
     def get_action(self, state):
         """
@@ -103,35 +103,8 @@ class PacmanAgent(Agent):
         -------
         - A list of legal moves as defined in `game.Directions`.
         """
-        self.init_food_list = state.getFood().asList()
-        fringe = PriorityQueue()
-        fringe.push((state, [], 0), 0)
-        closed = set()
-
-        while True:
-            # Failure case
-            if fringe.isEmpty() == 1:
-                return []
-
-            # Take the node with the lowest priority of the fringe
-            priority, (current, path, backward_cost) = fringe.pop()
-
-            # Win case
-            if current.isWin():
-                return path
-
-            # Take the key of the current state
-            current_key = self.key(current)
-
-            if current_key not in closed:
-                closed.add(current_key)
-
-                for next_state, action in current.generatePacmanSuccessors():
-                    next_key = self.key(next_state)
-                    if next_key not in closed:
-                        next_path = path + [action]
-                        next_backward_cost = g(backward_cost,
-                                               next_state.getNumFood())
-                        next_priority = h(next_state) + next_backward_cost
-                        fringe.push((next_state, next_path,
-                                     next_backward_cost), next_priority)
+        # Without ghosts, the search runs on positions and food only
+        start = searchStart(state)
+        self.packed_key = PackedKey(start)
+        return GraphSearch(PriorityFrontier(), self.key, g, h,
+                           childKey=self.packed_key.child).search(start)
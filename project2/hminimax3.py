@@ -1,5 +1,6 @@
 from pacman_module.game import Agent
 from pacman_module.pacman import Directions
+from pacman_module.search import PackedKey
 from pacman_module.util import manhattanDistance
 import math
 import random
@@ -18,7 +19,7 @@ class PacmanAgent(Agent):
         """
         super().__init__()
         self.args = args
-        self.init_food_list = []
+        self.packed_key = None
         self.moves = []
         self.state_list = set()
         self.init_number_food = 0
@@ -33,12 +34,11 @@ class PacmanAgent(Agent):
                    `pacman.GameState`.
         Return:
         -------
-        - A hashable key object that uniquely identifies a Pacman game state.
+        - A hashable key object that uniquely identifies a Pacman game state:
+        an integer packing Pacman's position, the ghost's position and the
+        remaining food.
         """
-        return tuple(state.getPacmanPosition()) + tuple(
-            state.getGhostPosition(1)) + tuple(
-            [(1 if state.hasFood(food[0], food[1]) else 0) for food in
-             self.init_food_list])
+        return self.packed_key(state)
 
     def get_action(self, state):
         """
@@ -74,7 +74,7 @@ class PacmanAgent(Agent):
         - A list of legal moves as defined in `game.Directions`.
         """
         # Initialization
-        self.init_food_list = state.getFood().asList()
+        self.packed_key = PackedKey(state, numGhosts=1)
         self.init_number_food = state.getNumFood()
         closed = set()
 
@@ -180,11 +180,12 @@ class PacmanAgent(Agent):
             # with the corresponding worst path
             if player == 1:
                 min_score = math.inf
-                successors = current.generateGhostSuccessors(1)
-                for next_state, action in successors:
+                for action in current.expandActions(1):
+                    current.apply(1, action)
                     next_score, next_path = self.hminimax_rec(
-                        next_state, not player, depth + 1, l_depth,
+                        current, not player, depth + 1, l_depth,
                         closed.copy(), init_position)
+                    current.undo()
                     if min_score > next_score:
                         min_score = next_score
                         chosen_next_path = next_path
@@ -196,11 +197,12 @@ class PacmanAgent(Agent):
             if player == 0:
                 max_score = -math.inf
                 chosen_action = 'Stop'
-                successors = current.generatePacmanSuccessors()
-                for next_state, action in successors:
+                for action in current.expandActions():
+                    current.apply(0, action)
                     next_score, next_path = self.hminimax_rec(
-                        next_state, not player, depth + 1, l_depth,
+                        current, not player, depth + 1, l_depth,
                         closed.copy(), init_position)
+                    current.undo()
                     if max_score < next_score:
                         max_score = next_score
                         chosen_action = action
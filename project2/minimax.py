@@ -130,10 +130,11 @@ class PacmanAgent(Agent):
         # with the corresponding worst path
         if player == 1:
             min_score = math.inf
-            successors = current.generateGhostSuccessors(1)
-            for next_state, action in successors:
+            for action in current.expandActions(1):
+                current.apply(1, action)
                 next_score, next_path = self.minimax_rec(
-                    next_state, not player, depth, closed.copy())
+                    current, not player, depth, closed.copy())
+                current.undo()
                 if min_score > next_score:
                     min_score = next_score
                     chosen_next_path = next_path
@@ -145,10 +146,11 @@ class PacmanAgent(Agent):
         if player == 0:
             max_score = -math.inf
             chosen_action = 'Stop'
-            successors = current.generatePacmanSuccessors()
-            for next_state, action in successors:
+            for action in current.expandActions():
+                current.apply(0, action)
                 next_score, next_path = self.minimax_rec(
-                    next_state, not player, depth + 1, closed.copy())
+                    current, not player, depth + 1, closed.copy())
+                current.undo()
                 if max_score < next_score:
                     max_score = next_score
                     chosen_action = action
@@ -0,0 +1,152 @@
+# foodHeuristics.py
+# -----------------
+# Lower bounds of the number of moves needed to eat all the food, from the
+# maze distances of the layout.
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from .mazeDistances import getMazeDistances
+from .search import FoodSearchState
+
+# Food masks whose part of the bound is kept by a heuristic
+MEMO_SIZE = 1 << 16
+
+
+class FoodHeuristic(ABC):
+    """
+    Base class of the food heuristics: called on a state (a game state or
+    a FoodSearchState), it returns a lower bound of the number of moves
+    Pacman needs to eat all the remaining food, ignoring the ghosts.
+
+    The bounds use maze distances, so that they are admissible and
+    consistent for unit moves.  The part of a bound that only depends on
+    the food is computed by `foodBound` and memoized for the last
+    `memoSize` food masks used; `bound` completes it with the distances
+    from Pacman's cell.
+
+    Only the distances to the food dots of the layout, which the food of a
+    game never outgrows, are extracted from the table: `rows` holds the
+    distances between the dots, by dot number, and `cellRows` those from
+    the cells Pacman was in to the dots, built on first use.
+    """
+
+    def __init__(self, layout, memoSize=MEMO_SIZE):
+        self.table = getMazeDistances(layout)
+        self.height = layout.height
+        # The column of the table of each dot and the number of the dot
+        # of each index of the food bitmask
+        self.columns = []
+        self.dots = [None] * (layout.width * layout.height)
+        for x, y in layout.food.asList():
+            self.dots[x * self.height + y] = len(self.columns)
+            self.columns.append(self.table.index[(x, y)])
+        self.rows = self.table.rows(self.columns, self.columns)
+        self.cellRows = {}
+        self.foodEntry = lru_cache(memoSize)(
+            lambda food: self.foodBound(self.pellets(food)))
+
+    def __call__(self, state):
+        if isinstance(state, FoodSearchState):
+            cell, food = state.cell, state.food
+        else:
+            x, y = state.getPacmanPosition()
+            cell, food = x * self.height + y, state.data.food.bits
+        if food == 0:
+            return 0
+        row = self.cellRows.get(cell)
+        if row is None:
+            source = self.table.index[divmod(cell, self.height)]
+            row = self.table.rows([source], self.columns)[0]
+            self.cellRows[cell] = row
+        return self.bound(row, self.foodEntry(food))
+
+    def pellets(self, food):
+        """
+        Returns the list of the numbers of the dots of a food bitmask.
+        """
+        pellets = []
+        while food:
+            low = food & -food
+            pellets.append(self.dots[low.bit_length() - 1])
+            food ^= low
+        return pellets
+
+    def foodBound(self, pellets):
+        """
+        Returns what `bound` needs of the non-empty list of `pellets`.
+        """
+        return pellets
+
+    @abstractmethod
+    def bound(self, row, entry):
+        """
+        Returns the bound from Pacman's cell, whose distances to the other
+        cells are `row`, given the memoized `entry` of the food.
+        """
+
+
+class FarthestFood(FoodHeuristic):
+    """
+    The maze distance to the farthest food dot.
+    """
+
+    def bound(self, row, pellets):
+        return max(row[pellet] for pellet in pellets)
+
+
+class SpanningTreeFood(FoodHeuristic):
+    """
+    The weight of a minimum spanning tree of the food dots, with maze
+    distances, plus the distance to the nearest dot: a path eating all the
+    food reaches a first dot, then spans the others.
+    """
+
+    def foodBound(self, pellets):
+        # Prim's algorithm on the complete graph of the dots
+        remaining = pellets[1:]
+        nearest = [self.rows[pellets[0]][pellet] for pellet in remaining]
+        weight = 0
+        while remaining:
+            i = min(range(len(remaining)), key=nearest.__getitem__)
+            weight += nearest[i]
+            row = self.rows[remaining[i]]
+            remaining[i], nearest[i] = remaining[-1], nearest[-1]
+            remaining.pop()
+            nearest.pop()
+            nearest = [min(distance, row[pellet])
+                       for distance, pellet in zip(nearest, remaining)]
+        return pellets, weight
+
+    def bound(self, row, entry):
+        pellets, weight = entry
+        return weight + min(row[pellet] for pellet in pellets)
+
+
+class FarthestPairFood(FoodHeuristic):
+    """
+    The maze distance between the two food dots farthest apart, plus the
+    distance to the nearest of them: a path eating all the food reaches
+    one of them, then the other.
+    """
+
+    def foodBound(self, pellets):
+        first = second = pellets[0]
+        farthest = 0
+        for i, a in enumerate(pellets):
+            row = self.rows[a]
+            for b in pellets[i + 1:]:
+                if row[b] > farthest:
+                    first, second, farthest = a, b, row[b]
+        return first, second, farthest
+
+    def bound(self, row, entry):
+        first, second, farthest = entry
+        return farthest + min(row[first], row[second])
+
+
+HEURISTICS = {
+    'farthest': FarthestFood,
+    'mst': SpanningTreeFood,
+    'pairwise': FarthestPairFood,
+}
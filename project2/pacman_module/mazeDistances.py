@@ -0,0 +1,199 @@
+# mazeDistances.py
+# ----------------
+# All-pairs maze distances of a layout, computed once and cached on disk.
+
+import hashlib
+import os
+import weakref
+
+import numpy as np
+
+# Next to the bytecode cache, which is not under version control
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '__pycache__', 'mazeDistances')
+
+# Distance between positions with no path between them
+UNREACHABLE = float('inf')
+
+# Tables in use, by layout key: a table is dropped once no layout nor
+# heuristic refers to it
+_TABLES = weakref.WeakValueDictionary()
+
+# Tables of the layouts (or wall grids) already queried, by id, with a weak
+# reference to the object itself, so that a reused id is not mistaken for
+# it and the entry goes with the object
+_OBJECTS = {}
+
+
+def layoutKey(walls):
+    """
+    Returns a key of the content of a wall grid: two layouts with the same
+    walls have the same distances.
+    """
+    cells = np.array(walls.data, dtype=bool)
+    digest = hashlib.sha1(np.packbits(cells).tobytes()).hexdigest()
+    return '%dx%d-%s' % (cells.shape[0], cells.shape[1], digest)
+
+
+def allPairsDistances(walls):
+    """
+    Computes the maze distances between all the free cells of `walls` with
+    one breadth-first search from every cell at once: each step moves the
+    frontiers of all the searches to the neighbours of their cells with a
+    few array operations.
+
+    Returns the F*2 coordinates of the F free cells and the F*F matrix of
+    their distances, -1 for the pairs with no path between them.
+    """
+    free = ~np.array(walls.data, dtype=bool)
+    width, height = free.shape
+    cells = np.argwhere(free)
+    index = np.full(free.shape, -1)
+    index[cells[:, 0], cells[:, 1]] = np.arange(len(cells))
+
+    # The neighbours of each free cell, itself standing for a wall
+    neighbours = np.repeat(np.arange(len(cells))[:, None], 4, axis=1)
+    for k, (dx, dy) in enumerate([(0, 1), (0, -1), (1, 0), (-1, 0)]):
+        x, y = cells[:, 0] + dx, cells[:, 1] + dy
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        other = np.full(len(cells), -1)
+        other[inside] = index[x[inside], y[inside]]
+        neighbours[other >= 0, k] = other[other >= 0]
+
+    # The frontier of all the searches is the list of its (source, cell)
+    # pairs, as flat indices of the distance matrix
+    n = len(cells)
+    distances = np.full((n, n), -1, dtype=np.int16 if n < 2 ** 15
+                        else np.int32)
+    flat = distances.ravel()
+    sources = np.arange(n) * n
+    reached = np.arange(n)
+    flat[sources + reached] = 0
+    step = 0
+    while len(reached):
+        step += 1
+        pairs = (sources[:, None] + neighbours[reached]).ravel()
+        pairs = pairs[flat[pairs] < 0]
+        # A cell reached from several cells of a frontier is kept once:
+        # each pair writes its own (negative) label and only the last
+        # writer keeps it, without sorting
+        labels = -2 - np.arange(len(pairs)) % 32000
+        flat[pairs] = labels
+        pairs = pairs[flat[pairs] == labels]
+        flat[pairs] = step
+        sources, reached = np.divmod(pairs, n)
+        sources *= n
+    return cells, distances
+
+
+class MazeDistances:
+    """
+    The maze distances between the free cells of a layout, with walls,
+    where util.manhattanDistance ignores them.  distance(a, b) is a table
+    lookup.  The table is kept as the F*F array of the distances, -1 for
+    the unreachable pairs; `rows` extracts the lists that the loops over
+    distances index.
+    """
+
+    def __init__(self, cells, distances):
+        self.index = {(int(x), int(y)): i for i, (x, y) in enumerate(cells)}
+        self.distances = distances
+
+    def distance(self, a, b):
+        """
+        Returns the length of a shortest path between cells `a` and `b`,
+        UNREACHABLE if there is none.
+        """
+        d = self.distances[self.index[a], self.index[b]]
+        return int(d) if d >= 0 else UNREACHABLE
+
+    def rows(self, sources, targets=None):
+        """
+        Returns the distances from the cells of indices `sources` to those
+        of indices `targets` (all the cells by default), as a list of
+        lists, UNREACHABLE for the unreachable pairs.
+        """
+        block = self.distances[sources]
+        if targets is not None:
+            block = block[:, targets]
+        unreachable = block < 0
+        if unreachable.any():
+            block = block.astype(object)
+            block[unreachable] = UNREACHABLE
+        return block.tolist()
+
+    def distancesFrom(self, a):
+        """
+        Returns the list of the distances from `a` to all the free cells,
+        in the order of `cells`, UNREACHABLE for the unreachable ones.
+        """
+        return self.rows([self.index[a]])[0]
+
+    @property
+    def cells(self):
+        return list(self.index)
+
+
+def getMazeDistances(layout, cacheDir=CACHE_DIR):
+    """
+    Returns the MazeDistances of a layout (or of a wall grid), loaded from
+    memory or from `cacheDir` when they were computed before for the same
+    walls, and computed and saved there otherwise.  The table is kept with
+    the layout object, so that later calls with it do not hash its walls.
+    """
+    entry = _OBJECTS.get(id(layout))
+    if entry is not None and entry[0]() is layout:
+        return entry[1]
+
+    walls = getattr(layout, 'walls', layout)
+    key = layoutKey(walls)
+    table = _TABLES.get(key)
+    if table is not None:
+        _remember(layout, table)
+        return table
+
+    path = None if cacheDir is None else \
+        os.path.join(cacheDir, key + '.npz')
+    if path is not None and os.path.exists(path):
+        with np.load(path) as f:
+            cells, distances = f['cells'], f['distances']
+    else:
+        cells, distances = allPairsDistances(walls)
+        if path is not None:
+            try:
+                os.makedirs(cacheDir, exist_ok=True)
+                # Written aside and renamed, so that concurrent games never
+                # read a partial file
+                temporary = '%s.%d.npz' % (path[:-4], os.getpid())
+                np.savez_compressed(temporary, cells=cells,
+                                    distances=distances)
+                os.replace(temporary, path)
+            except OSError:
+                pass
+
+    table = MazeDistances(cells, distances)
+    _TABLES[key] = table
+    _remember(layout, table)
+    return table
+
+
+def _remember(layout, table):
+    """
+    Keeps `table` as the table of the object `layout`, as long as it lives.
+    """
+    key = id(layout)
+
+    def forget(reference):
+        if _OBJECTS.get(key, (None,))[0] is reference:
+            del _OBJECTS[key]
+
+    _OBJECTS[key] = (weakref.ref(layout, forget), table)
+
+
+def distance(layout, a, b):
+    """
+    Returns the maze distance between cells `a` and `b` of `layout`.  The
+    first call with a layout object finds its table, the later ones are
+    two dictionary lookups.
+    """
+    return getMazeDistances(layout).distance(a, b)
@@ -0,0 +1,326 @@
+# search.py
+# ---------
+# Graph search over Pacman game states, shared by the search agents.
+
+from collections import deque
+
+from .game import BitGrid
+from .pacman import GameState
+from .util import PriorityQueue
+
+
+class SearchNode:
+    """
+    A node of the search tree: a state, the node it was generated from,
+    the action leading to it and its backward cost.  The path to a node
+    is only built, by following the parents, once a goal is found.
+    """
+
+    __slots__ = ('state', 'key', 'parent', 'action', 'cost')
+
+    def __init__(self, state, key, parent=None, action=None, cost=0):
+        self.state = state
+        self.key = key
+        self.parent = parent
+        self.action = action
+        self.cost = cost
+
+    def path(self):
+        """
+        Returns the list of actions leading from the root to this node.
+        """
+        actions = []
+        node = self
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+        actions.reverse()
+        return actions
+
+
+class FifoFrontier:
+    """
+    Breadth-first frontier: nodes are popped in the order they were
+    pushed, whatever their priority.
+    """
+
+    def __init__(self):
+        self.nodes = deque()
+
+    def push(self, node, priority):
+        self.nodes.append(node)
+
+    def pop(self):
+        return self.nodes.popleft()
+
+    def isEmpty(self):
+        return len(self.nodes) == 0
+
+
+class LifoFrontier:
+    """
+    Depth-first frontier: the last pushed node is popped first, whatever
+    its priority.
+    """
+
+    def __init__(self):
+        self.nodes = []
+
+    def push(self, node, priority):
+        self.nodes.append(node)
+
+    def pop(self):
+        return self.nodes.pop()
+
+    def isEmpty(self):
+        return len(self.nodes) == 0
+
+
+class PriorityFrontier:
+    """
+    Best-first frontier: the node of lowest priority is popped first, ties
+    being broken in the order the nodes were pushed.
+    """
+
+    def __init__(self):
+        self.queue = PriorityQueue()
+
+    def push(self, node, priority):
+        self.queue.push(node, priority)
+
+    def pop(self):
+        return self.queue.pop()[1]
+
+    def isEmpty(self):
+        return self.queue.isEmpty()
+
+
+FRONTIERS = {
+    'fifo': FifoFrontier,
+    'lifo': LifoFrontier,
+    'priority': PriorityFrontier,
+}
+
+
+class PackedKey:
+    """
+    Encodes the states of a search as integers: the food bitmask in the
+    low width * height bits (as BitGrid stores it), then Pacman's cell and
+    then the position of ghosts 1 to `numGhosts` on a grid of half cells,
+    since scared ghosts move by half cells.
+
+    Called on a state, it builds its key; `child` derives the key of a
+    successor by a move of Pacman from the key of its parent, with a
+    constant number of operations whatever the number of food dots.
+    """
+
+    def __init__(self, state, numGhosts=0):
+        food = state.getFood()
+        self.height = food.height
+        self.cells = food.width * food.height
+        self.cellBits = max(self.cells - 1, 1).bit_length()
+        self.cellMask = ((1 << self.cellBits) - 1) << self.cells
+        self.ghostBits = max(4 * self.cells - 1, 1).bit_length()
+        self.numGhosts = numGhosts
+
+    def __call__(self, state):
+        if isinstance(state, FoodSearchState):
+            return state.food | state.cell << self.cells
+        x, y = state.getPacmanPosition()
+        key = state.data.food.bits | (x * self.height + y) << self.cells
+        shift = self.cells + self.cellBits
+        for index in range(1, self.numGhosts + 1):
+            gx, gy = state.getGhostPosition(index)
+            half = int(2 * gx) * 2 * self.height + int(2 * gy)
+            key |= half << shift
+            shift += self.ghostBits
+        return key
+
+    def child(self, parentKey, state):
+        """
+        Returns the key of `state`, a successor of the state of
+        `parentKey` in which only Pacman moved.
+        """
+        if isinstance(state, FoodSearchState):
+            return state.food | state.cell << self.cells
+        x, y = state.getPacmanPosition()
+        key = parentKey & ~self.cellMask | (x * self.height + y) << self.cells
+        eaten = state.data._foodEaten
+        if eaten is not None:
+            key &= ~(1 << (eaten[0] * self.height + eaten[1]))
+        return key
+
+
+class FoodSearchProblem:
+    """
+    The problem of eating all the food of a layout without ghosts, compiled
+    from the layout: a state only holds Pacman's cell and the food bitmask
+    (see FoodSearchState), and its successors are read from a table of the
+    moves of each cell instead of being generated by the game rules.
+
+    The successors are generated in the order of
+    GameState.generatePacmanSuccessors and each expansion is counted in
+    GameState.countExpanded, so that a search expands the same nodes and
+    reports the same number of expanded nodes as on game states.
+    """
+
+    def __init__(self, layout):
+        self.width = layout.width
+        self.height = layout.height
+        self.cells = layout.width * layout.height
+        self.positions = [divmod(cell, self.height)
+                          for cell in range(self.cells)]
+        self.moves = [()] * self.cells
+        for (x, y), neighbors in layout.neighbors.items():
+            self.moves[x * self.height + y] = tuple(
+                (action, nx * self.height + ny)
+                for action, (nx, ny) in neighbors)
+
+    def fromGameState(self, state):
+        """
+        Returns the FoodSearchState of Pacman's position and of the food of
+        a game state on the layout of the problem.
+        """
+        x, y = state.getPacmanPosition()
+        return FoodSearchState(self, x * self.height + y,
+                               state.data.food.bits, state.isWin())
+
+
+class FoodSearchState:
+    """
+    A state of a FoodSearchProblem, answering the queries of GameState
+    that the search agents make.
+    """
+
+    __slots__ = ('problem', 'cell', 'food', 'win')
+
+    def __init__(self, problem, cell, food, win=False):
+        self.problem = problem
+        self.cell = cell
+        self.food = food
+        self.win = win
+
+    def getPacmanPosition(self):
+        return self.problem.positions[self.cell]
+
+    def getNumFood(self):
+        return bin(self.food).count('1')
+
+    def getFood(self):
+        return BitGrid(self.problem.width, self.problem.height,
+                       bits=self.food)
+
+    def hasFood(self, x, y):
+        return (self.food >> (x * self.problem.height + y)) & 1 == 1
+
+    def isWin(self):
+        return self.win
+
+    def isLose(self):
+        return False
+
+    def generatePacmanSuccessors(self):
+        """
+        Returns the list of pairs of successor states and moves, as
+        GameState.generatePacmanSuccessors does.
+        """
+        if GameState.countExpanded >= GameState.maximumExpanded:
+            return None
+        GameState.countExpanded += 1
+        successors = []
+        for action, cell in self.problem.moves[self.cell]:
+            bit = 1 << cell
+            if self.food & bit:
+                food = self.food ^ bit
+                successors.append((FoodSearchState(
+                    self.problem, cell, food, food == 0), action))
+            else:
+                successors.append((FoodSearchState(
+                    self.problem, cell, self.food), action))
+        return successors
+
+
+def searchStart(state):
+    """
+    Returns the state a search for the food of game state `state` starts
+    from: its FoodSearchState when Pacman is alone in the game, and the
+    game state itself otherwise.
+    """
+    if state.getNumAgents() > 1:
+        return state
+    return FoodSearchProblem(state.data.layout).fromGameState(state)
+
+
+def unitCost(backwardCost, state):
+    return backwardCost + 1
+
+
+def nullHeuristic(state):
+    return 0
+
+
+class GraphSearch:
+    """
+    Graph search from a game state to a winning state, over the moves of
+    Pacman.
+
+    The order in which the nodes are expanded is that of the `frontier`
+    (see FRONTIERS), to which each generated node is pushed with the
+    priority g + h: `g(backwardCost, state)` gives the backward cost of a
+    state from the one of its parent, and `h(state)` the heuristic.  A
+    state is expanded at most once per key of `key(state)`, and its
+    successors whose key is already closed are not pushed unless
+    `pruneClosed` is False.  The key of a successor is computed once,
+    with `childKey(parentKey, state)` if given (see PackedKey.child).
+    """
+
+    def __init__(self, frontier, key, g=unitCost, h=nullHeuristic,
+                 pruneClosed=True, childKey=None):
+        self.frontier = frontier
+        self.key = key
+        self.childKey = childKey
+        self.g = g
+        self.h = h
+        self.pruneClosed = pruneClosed
+        self.closed = set()
+
+    def isGoal(self, state):
+        return state.isWin()
+
+    def close(self, node):
+        """
+        Returns whether `node` is to be expanded, and closes its key.
+        """
+        if node.key in self.closed:
+            return False
+        self.closed.add(node.key)
+        return True
+
+    def search(self, state):
+        """
+        Returns the list of moves leading from `state` to the first goal
+        state popped from the frontier, or an empty list if there is none.
+        """
+        self.closed = set()
+        self.frontier.push(SearchNode(state, self.key(state)), 0)
+
+        while not self.frontier.isEmpty():
+            node = self.frontier.pop()
+            if self.isGoal(node.state):
+                return node.path()
+            if not self.close(node):
+                continue
+
+            for nextState, action in \
+                    node.state.generatePacmanSuccessors() or []:
+                if self.childKey is None:
+                    nextKey = self.key(nextState)
+                else:
+                    nextKey = self.childKey(node.key, nextState)
+                if self.pruneClosed and nextKey in self.closed:
+                    continue
+                cost = self.g(node.cost, nextState)
+                self.frontier.push(
+                    SearchNode(nextState, nextKey, node, action, cost),
+                    cost + self.h(nextState))
+        return []
@@ -0,0 +1,211 @@
+import csv
+import io
+import itertools
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import numpy as np
+
+from pacman_module.pacman import runGame
+from run import build_parser, ghosts, load_agent_from_file, \
+    strictly_positive_integer
+
+# Result columns, after the swept parameters
+RESULT_FIELDS = ["steps", "score", "computation_time", "expanded_nodes"]
+
+
+class GameTooLong(Exception):
+    """
+    Raised by a `bounded` agent to end its game.
+    """
+
+
+def bounded(agent_class, maxsteps):
+    """
+    Returns a subclass of the agent class `agent_class` that counts its
+    steps and the score of the last state it observed, and ends the game,
+    by raising `GameTooLong`, after `maxsteps` steps.
+    """
+    class BoundedAgent(agent_class):
+        steps = 0
+        score = np.nan
+
+        def get_action(self, state):
+            action = super().get_action(state)
+            self.steps += 1
+            self.score = state.getScore()
+            if self.steps >= maxsteps:
+                raise GameTooLong()
+            return action
+
+    return BoundedAgent
+
+
+def make_configurations(agentfiles, ghostagents, layouts, seeds):
+    """
+    Given:
+    -------
+    - `agentfiles`, `ghostagents`, `layouts`, `seeds`: the values swept
+      for each parameter.
+
+    Return:
+    -------
+    - A list of dictionaries, one per game of the grid, mapping the
+      names of the parameters to their values.
+    """
+    return [dict(agentfile=a, ghostagent=g, layout=l, seed=s)
+            for a, g, l, s in itertools.product(
+                agentfiles, ghostagents, layouts, seeds)]
+
+
+def play_configuration(job):
+    """
+    Plays one game of a batch in a worker process.
+
+    Arguments:
+    ----------
+    - `job`: the base command-line arguments, the configuration
+      overriding them and the maximum number of steps of the game.
+
+    Return:
+    -------
+    - The configuration, completed with the results of the game. The
+      steps are those of the belief state agent (of Pacman if there is
+      none). A game stopped after the maximum number of steps reports
+      the score of the last state observed, and NaN as computation time
+      and expanded nodes.
+    """
+    base, configuration, maxsteps = job
+    args = Namespace(**vars(base))
+    for key, value in configuration.items():
+        setattr(args, key, value)
+
+    # Seed every game, so that a game does not depend on the worker
+    # nor on the games played before it
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    agent_class = load_agent_from_file(args.agentfile, "PacmanAgent")
+    gagts = [ghosts[args.ghostagent](i + 1, args)
+             for i in range(max(args.nghosts, 0))]
+    bsagt = None
+    if args.bsagentfile is None:
+        agent = bounded(agent_class, maxsteps)(args)
+        counter = agent
+    else:
+        agent = agent_class(args)
+        bsagt = bounded(load_agent_from_file(
+            args.bsagentfile, "BeliefStateAgent"), maxsteps)(args)
+        counter = bsagt
+
+    with redirect_stdout(io.StringIO()):
+        try:
+            score, computation_time, expanded_nodes = runGame(
+                args.layout, agent, gagts, bsagt, False, expout=0,
+                hiddenGhosts=args.hiddenghosts,
+                edibleGhosts=args.edibleghosts)
+        except GameTooLong:
+            score, computation_time, expanded_nodes = \
+                counter.score, np.nan, np.nan
+
+    result = dict(configuration)
+    result.update(steps=counter.steps, score=score,
+                  computation_time=computation_time,
+                  expanded_nodes=expanded_nodes)
+    return result
+
+
+def run_batch(base, configurations, maxsteps, processes=None):
+    """
+    Plays all the games of `configurations`, of at most `maxsteps` steps
+    each, in a pool of `processes` worker processes (one per core by
+    default).
+
+    Arguments:
+    ----------
+    - `base`: command-line arguments of `run.py` shared by all games.
+    - `configurations`: list of dictionaries of arguments overriding
+      `base`, see `make_configurations`.
+
+    Return:
+    -------
+    - The list of results, in the order of `configurations`.
+    """
+    base = Namespace(**vars(base))
+    base.silentdisplay = True
+    base.metricsfile = None
+    base.metricsflush = sys.maxsize
+
+    jobs = [(base, configuration, maxsteps)
+            for configuration in configurations]
+    with Pool(processes) as pool:
+        return list(pool.imap(play_configuration, jobs, chunksize=1))
+
+
+def write_results(results, f):
+    if not results:
+        return
+    fields = [key for key in results[0] if key not in RESULT_FIELDS]
+    writer = csv.DictWriter(f, fieldnames=fields + RESULT_FIELDS)
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python batch.py <sweep_options> <game_options>
+    EXAMPLES:   (1) python batch.py --bsagentfile bayesfilter.py
+                        --ghostagents confused afraid scared --seeds 1 2 3
+                    - plays the 9 games of the grid on all cores,
+                      stopping each after 1000 steps,
+                      and prints their results as CSV
+
+    Game options are those of run.py and are shared by all games.
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        '--agentfiles',
+        help='Python files containing a `PacmanAgent` class.',
+        nargs='+', default=["pacmanagent.py"])
+    parser.add_argument(
+        '--ghostagents',
+        help='Ghost agents available in the `ghostAgents` module.',
+        nargs='+', choices=["confused", "afraid", "scared"],
+        default=["confused"])
+    parser.add_argument(
+        '--layouts',
+        help='Maze layouts (from layout folder).',
+        nargs='+', default=["large_filter"])
+    parser.add_argument(
+        '--seeds',
+        help='Seeds for the random number generators, one game per seed.',
+        nargs='+', type=int, default=[1])
+    parser.add_argument(
+        '--maxsteps',
+        help='Maximum number of steps of a game.',
+        type=strictly_positive_integer, default=1000)
+    parser.add_argument(
+        '--processes',
+        help='Number of worker processes (default: number of cores).',
+        type=int, default=None)
+    parser.add_argument(
+        '--output',
+        help='CSV file receiving the results (default: standard output).',
+        default=None)
+
+    args, game_argv = parser.parse_known_args()
+    base = build_parser().parse_args(game_argv)
+
+    configurations = make_configurations(
+        args.agentfiles, args.ghostagents, args.layouts, args.seeds)
+    results = run_batch(base, configurations, args.maxsteps, args.processes)
+
+    if args.output is None:
+        write_results(results, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as f:
+            write_results(results, f)
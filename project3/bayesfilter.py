@@ -1,10 +1,160 @@
 # Complete this class for all parts of the project
 
+from collections import OrderedDict
+
 from pacman_module.game import Agent
 import numpy as np
 from pacman_module import util
 
 
+class TransitionCache:
+    """
+    Least recently used cache of the sparse ghost transition matrices.
+
+    The transition model only depends on the layout, the ghost type and
+    pacman's position, which pacman keeps coming back to, so each matrix
+    is built once and kept until `capacity` more recent ones push it out.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.matrices = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """
+        Returns the matrix stored under `key`, built with `build()` and
+        stored on a miss.
+        """
+        matrix = self.matrices.get(key)
+        if matrix is not None:
+            self.hits += 1
+            self.matrices.move_to_end(key)
+            return matrix
+        self.misses += 1
+        matrix = build()
+        self.matrices[key] = matrix
+        if len(self.matrices) > self.capacity:
+            self.matrices.popitem(last=False)
+        return matrix
+
+
+# Shared by all the agents, so that successive games on a layout reuse it
+TRANSITION_CACHE = TransitionCache()
+
+# Error metrics of the belief states, see `belief_metrics`
+METRICS = ["argmax error", "expected error", "true position probability",
+           "entropy"]
+
+# File receiving the running metrics of the games, see `RunningMetrics`
+METRICS_FILE = "metrics.csv"
+
+
+def belief_metrics(beliefStates, ghosts):
+    """
+    Computes the error metrics of belief states.
+
+    Arguments:
+    ----------
+    - `beliefStates`: ...*Z*N*M belief states, for any leading dimensions.
+    - `ghosts`: ...*Z*2 true positions of the ghosts.
+
+    Return:
+    -------
+    - A dictionary mapping each name of METRICS to a ...*Z array, NaN for
+      the ghosts outside of the grid (eaten ghosts wait at (-10, -10)).
+    """
+    beliefStates = np.asarray(beliefStates)
+    ghosts = np.asarray(ghosts, dtype=int)
+    width, height = beliefStates.shape[-2:]
+    x, y = np.indices((width, height))
+    true_x, true_y = ghosts[..., 0], ghosts[..., 1]
+    inside = (true_x >= 0) & (true_x < width) & \
+        (true_y >= 0) & (true_y < height)
+    true_x, true_y = np.where(inside, true_x, 0), np.where(inside, true_y, 0)
+    flat = beliefStates.reshape(beliefStates.shape[:-2] + (-1,))
+    guess_x, guess_y = np.unravel_index(flat.argmax(axis=-1),
+                                        (width, height))
+    distances = np.abs(x - true_x[..., None, None]) + \
+        np.abs(y - true_y[..., None, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entropy = -np.where(beliefStates > 0,
+                            beliefStates * np.log(beliefStates), 0)
+
+    metrics = {
+        "argmax error": np.abs(guess_x - true_x) + np.abs(guess_y - true_y),
+        "expected error": (beliefStates * distances).sum(axis=(-2, -1)),
+        "true position probability": np.take_along_axis(
+            flat, (true_x * height + true_y)[..., None], axis=-1)[..., 0],
+        "entropy": entropy.sum(axis=(-2, -1)),
+    }
+    return {name: np.where(inside, values, np.nan)
+            for name, values in metrics.items()}
+
+
+class RunningMetrics:
+    """
+    Running mean and variance (Welford's algorithm) of the metrics of
+    METRICS for each ghost, in constant memory however long the game.
+    The NaN values of a ghost, when it is out of the maze, are skipped.
+
+    Every `flush_every` steps and when the game ends, the summary (mean,
+    standard deviation and half-width of the 95% confidence interval of
+    the mean) is appended to the CSV file `path`, or printed when it is
+    None.
+    """
+
+    def __init__(self, nghosts, path=METRICS_FILE, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.count = 0
+        self.counts = np.zeros(nghosts, dtype=int)
+        self.means = np.zeros((len(METRICS), nghosts))
+        self.squares = np.zeros((len(METRICS), nghosts))
+
+    def add(self, metrics):
+        """
+        Adds the values of one step, given as a dictionary mapping each
+        name of METRICS to the Z values of the ghosts.
+        """
+        values = np.array([metrics[name] for name in METRICS], dtype=float)
+        valid = ~np.isnan(values).any(axis=0)
+        self.count += 1
+        self.counts += valid
+        delta = np.where(valid, values - self.means, 0)
+        self.means += delta / np.maximum(self.counts, 1)
+        self.squares += delta * np.where(valid, values - self.means, 0)
+        if self.count % self.flush_every == 0:
+            self.flush()
+
+    def summary(self):
+        """
+        Returns the means, standard deviations and half-widths of the 95%
+        confidence intervals of the means, as three len(METRICS)*Z
+        matrices, NaN for the ghosts without values.
+        """
+        means = np.where(self.counts > 0, self.means, np.nan)
+        variances = self.squares / np.maximum(self.counts - 1, 1)
+        std = np.where(self.counts > 0, np.sqrt(variances), np.nan)
+        return means, std, 1.96 * std / np.sqrt(np.maximum(self.counts, 1))
+
+    def flush(self):
+        means, std, ci = self.summary()
+        rows = ["%d;%d;%s;%.6f;%.6f;%.6f" % (
+            self.count, ghost, name, means[m, ghost], std[m, ghost],
+            ci[m, ghost])
+            for m, name in enumerate(METRICS)
+            for ghost in range(means.shape[1])]
+        if self.path is None:
+            print("\n".join(rows))
+            return
+        with open(self.path, "a") as f:
+            if f.tell() == 0:
+                f.write("steps;ghost;metric;mean;std;ci95\n")
+            f.write("\n".join(rows) + "\n")
+
+
 class BeliefStateAgent(Agent):
     def __init__(self, args):
         """
@@ -23,11 +173,20 @@ class BeliefStateAgent(Agent):
         # Grid of walls (assigned with 'state.getWalls()' method)
         self.walls = None
 
+        # Positions the ghosts can leave, and their coordinates (free-cell
+        # index), derived from the walls on the first update
+        self.inner = None
+        self.free_cells = None
+        self.layout_key = None
+
+        # Cache of the transition matrices
+        self.transitions = TRANSITION_CACHE
+
         # Hyper-parameters
         self.ghost_type = self.args.ghostagent
         self.sensor_variance = self.args.sensorvariance
         self.counter = 0
-        self.metrics = 0
+        self.metrics = None
 
     def update_belief_state(self, evidences, pacman_position):
         """
@@ -57,63 +216,25 @@ class BeliefStateAgent(Agent):
 
         # XXX: Your code here
 
-        width = 21
-        height = 12
-
-        # Variable in which we will accumulate probabilities
-        beliefStates = np.zeros((len(evidences), width, height))
-
-        # Transition step
-        for k in range(len(evidences)):
-            for i in range(1, width - 1):
-                for j in range(1, height - 1):
-                    # For each no wall position, we add to the neighbour
-                    # the probabilities of being in the position * the
-                    # probability to go to a neighbour,
-                    # for each neighbour
-                    if self.walls[i][j] is False:
-                        j_p = pacman_position[1]
-                        i_p = pacman_position[0]
-                        current_prob = self.beliefGhostStates[k][i][j]
-                        current_prob_norm = 0
-                        c = 1
-                        if self.ghost_type == 'afraid':
-                            c = 2
-                        if self.ghost_type == 'scared':
-                            c = 2 ** 3
-
-                        norm = self.compute_norm(i, j, i_p, j_p, c)
-                        if norm > 0:
-                            current_prob_norm = current_prob / norm
-
-                        self.compute_belief_states(beliefStates, k, i, j, i_p,
-                                                   j_p, current_prob_norm,
-                                                   c)
-            # If first step, the sum of probabilities is not 0, so we normalize
-            if self.counter is 0:
-                beliefStates[k] = beliefStates[k] * 1 / sum(
-                    sum(beliefStates[k]))
-
-        # Update step
-        for k in range(len(evidences)):
-            for i in range(1, width - 1):
-                for j in range(1, height - 1):
-                    # For each no wall position, we multiply the probability by
-                    # a factor inversely proportional to the diff between
-                    # the current distance to pacman and the noisy distance
-                    # between pacman and ghost
-                    if self.walls[i][j] is False:
-                        current_dist = util.manhattanDistance(pacman_position,
-                                                              (i, j))
-                        dist_diff = current_dist - evidences[k]
-                        prob = 1 - abs(dist_diff) / (width + height)
-                        if prob < 0:
-                            prob = 0.0001
-
-                        beliefStates[k][i][j] = beliefStates[k][i][j] * prob
-
-            # We normalize the probabilities
-            beliefStates[k] = beliefStates[k] * 1 / sum(sum(beliefStates[k]))
+        if self.inner is None:
+            self.initialize_grid()
+
+        # Transition step, for all the ghosts at once
+        beliefStates = self.predict(np.asarray(beliefStates), pacman_position)
+
+        # If first step, the sum of probabilities is not 1, so we normalize
+        if self.counter == 0:
+            beliefStates /= beliefStates.sum(axis=(1, 2), keepdims=True)
+
+        # Update step: we multiply the probability of each no wall position
+        # by a factor inversely proportional to the diff between the
+        # distance to pacman and the noisy distance between pacman and ghost
+        i, j = self.free_cells
+        beliefStates[:, i, j] *= self.sensor_model(
+            [evidences], [pacman_position])[0]
+
+        # We normalize the probabilities
+        beliefStates /= beliefStates.sum(axis=(1, 2), keepdims=True)
 
         # XXX: End of your code
 
@@ -122,63 +243,139 @@ class BeliefStateAgent(Agent):
 
         return beliefStates
 
-    def compute_norm(self, i, j, i_p, j_p, c):
+    def initialize_grid(self):
+        """
+        Derives the shape of the maze and the free-cell index from the walls:
+        `inner` is the N*M boolean matrix of the no wall positions that are
+        not on the border of the maze, the positions the ghosts can leave,
+        and `free_cells` the pair of arrays of their coordinates.
+        """
+        walls = np.array(self.walls.data, dtype=bool)
+        inner = ~walls
+        inner[[0, -1], :] = False
+        inner[:, [0, -1]] = False
+        self.inner = inner
+        self.free_cells = np.nonzero(inner)
+        self.layout_key = (walls.shape, np.packbits(walls).tobytes())
+
+    def sensor_model(self, evidences, pacman_positions):
+        """
+        Probability of the evidences given each no wall position of the
+        ghosts, for T time steps at once.
+
+        Arguments:
+        ----------
+        - 'evidences': T*Z noisy distances between pacman and the ghosts
+        - 'pacman_positions': T*2 coordinates of pacman
+
+        Return:
+        -------
+        - A T*Z*F matrix, where F is the number of positions of
+          `free_cells`
+        """
+        width, height = self.inner.shape
+        i, j = self.free_cells
+        pacman_positions = np.asarray(pacman_positions)
+        distances = np.abs(i - pacman_positions[:, :1]) + \
+            np.abs(j - pacman_positions[:, 1:])
+        dist_diff = distances[:, None] - np.asarray(evidences)[..., None]
+        prob = 1 - np.abs(dist_diff) / (width + height)
+        prob[prob < 0] = 0.0001
+        return prob
+
+    def transition_weights(self, pacman_position):
         """
-        For a given current position and pacman position and a c value,
-        Gives the norm (see the definition in report)
+        For a given pacman position, gives the probability of each move of
+        the ghost from each position (see the definition in report)
 
         Arguments:
         ----------
-        - `i' and 'j' : current position
-        - 'i_p' and 'j_p' : pacman position
-        - 'c' : 1 if confused, 2 if afraid, 2 ** 3 if scared
+        - 'pacman_position': 2D coordinates position of pacman
 
         Return:
         -------
-        - The norm of c's  (see the definition in report)
+        - A list of pairs ((di, dj), P) where P is the N*M matrix of the
+          probabilities of moving by (di, dj) from each position
+        """
+        c = 1
+        if self.ghost_type == 'afraid':
+            c = 2
+        if self.ghost_type == 'scared':
+            c = 2 ** 3
+
+        walls = np.array(self.walls.data, dtype=bool)
+        inner = self.inner
+        i_p, j_p = pacman_position
+        i, j = np.indices(walls.shape)
+        free = ~walls
+
+        # The moves weighted by c are those that do not get closer to pacman
+        moves = [((0, -1), j_p >= j), ((0, 1), j_p <= j),
+                 ((1, 0), i_p <= i), ((-1, 0), i_p >= i)]
+        weights = []
+        for (di, dj), away in moves:
+            neighbour_free = np.zeros_like(free)
+            neighbour_free[1:-1, 1:-1] = free[1 + di:free.shape[0] - 1 + di,
+                                              1 + dj:free.shape[1] - 1 + dj]
+            weights.append(np.where(away, c, 1) * (neighbour_free & inner))
+
+        # The norm of c's (see the definition in report)
+        norm = sum(weights)
+        norm[norm == 0] = 1
+        return [(move, weight / norm)
+                for (move, _), weight in zip(moves, weights)]
+
+    def predict(self, beliefStates, pacman_position):
         """
-        norm = 0
-        if not self.walls[i][j - 1]:
-            norm += (c if j_p >= j else 1)
-        if not self.walls[i][j + 1]:
-            norm += (c if j_p <= j else 1)
-        if not self.walls[i + 1][j]:
-            norm += (c if i_p <= i else 1)
-        if not self.walls[i - 1][j]:
-            norm += (c if i_p >= i else 1)
+        Transition step: moves the probability mass of Z belief states
+        to the neighbour positions.
 
-        return norm
+        Arguments:
+        ----------
+        - 'beliefStates': Z*N*M belief states at state x_{t-1}
+        - 'pacman_position': 2D coordinates position of pacman
 
-    def compute_belief_states(self, beliefStates, k, i, j, i_p, j_p,
-                              prob, c):
+        Return:
+        -------
+        - The Z*N*M predicted belief states at state x_{t}
+        """
+        key = (self.layout_key, self.ghost_type, tuple(pacman_position))
+        sources, targets, probs = self.transitions.get(
+            key, lambda: self.transition_matrix(pacman_position))
+
+        # Sparse matrix-vector product, for all the ghosts at once
+        cells = beliefStates.shape[1] * beliefStates.shape[2]
+        flow = beliefStates.reshape(len(beliefStates), cells)[:, sources]
+        flow *= probs
+        predicted = np.stack([
+            np.bincount(targets, weights=ghost_flow, minlength=cells)
+            for ghost_flow in flow])
+        return predicted.reshape(beliefStates.shape)
+
+    def transition_matrix(self, pacman_position):
         """
-        For a given current position, pacman position, a c value and a
-        normalised probablity,
-        Add the computed probability values to belief states of neighbours
-        (after apply this function to all positions, we obtain the
-        transition model defines in the report)
+        Builds the sparse transition matrix of a ghost for a given pacman
+        position.
 
         Arguments:
         ----------
-        - 'k' : ghost number
-        - `i' and 'j' : current position
-        - 'i_p' and 'j_p' : pacman position
-        - 'prob  definition in report
-        - 'c' : 1 if confused, 2 if afraid, 2 ** 3 if scared
-        """
-
-        if not self.walls[i][j - 1]:
-            beliefStates[k][i][j - 1] += (prob * c if j_p >= j
-                                          else prob)
-        if not self.walls[i][j + 1]:
-            beliefStates[k][i][j + 1] += (prob * c if j_p <= j
-                                          else prob)
-        if not self.walls[i + 1][j]:
-            beliefStates[k][i + 1][j] += (prob * c if i_p <= i
-                                          else prob)
-        if not self.walls[i - 1][j]:
-            beliefStates[k][i - 1][j] += (prob * c if i_p >= i
-                                          else prob)
+        - 'pacman_position': 2D coordinates position of pacman
+
+        Return:
+        -------
+        - The matrix in coordinate format, as three arrays of the same
+          length: the flat indices of the origin and destination positions
+          of each move, and its probability
+        """
+        height = self.inner.shape[1]
+        sources, targets, probs = [], [], []
+        for (di, dj), prob in self.transition_weights(pacman_position):
+            origins = np.flatnonzero(prob)
+            sources.append(origins)
+            targets.append(origins + di * height + dj)
+            probs.append(prob.ravel()[origins])
+        return (np.concatenate(sources), np.concatenate(targets),
+                np.concatenate(probs))
 
     def _get_evidence(self, state):
         """
@@ -229,16 +426,33 @@ class BeliefStateAgent(Agent):
 
         N.B. : [0,0] is the bottom left corner of the maze
         """
-        if self.metrics is 0:
-            self.metrics = np.zeros((len(belief_states), 10000))
-        true_ghost_position = state.getGhostPosition(1)
-        for k in range(len(belief_states)):
-            belief_state = belief_states[k]
-            self.metrics[k, self.counter % 10000] = util.manhattanDistance(
-                true_ghost_position, np.unravel_index(belief_state.argmax(),
-                                                      belief_state.shape))
-        if self.counter > 10000:
-            print(np.mean(self.metrics[0]))
+        if self.metrics is None:
+            self.metrics = RunningMetrics(
+                len(belief_states),
+                getattr(self.args, 'metricsfile', METRICS_FILE),
+                getattr(self.args, 'metricsflush', 1000))
+        self.metrics.add(self.belief_metrics(belief_states,
+                                             state.getGhostPositions()))
+
+    def belief_metrics(self, belief_states, ghosts):
+        """
+        Computes the metrics recorded for the Z `belief_states` of the
+        agent, given the Z true positions `ghosts`: see `belief_metrics`.
+        """
+        return belief_metrics(belief_states, ghosts)
+
+    def final(self, state):
+        """
+        Called by the game once it is over: flushes the metrics of the
+        steps since the last summary.
+
+        Arguments:
+        ----------
+        - `state`: The final game state.
+        """
+        if self.metrics is not None and \
+                self.metrics.count % self.metrics.flush_every != 0:
+            self.metrics.flush()
 
     def get_action(self, state):
         """
@@ -0,0 +1,136 @@
+import os
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from pacman_module.layout import Layout
+from run import build_parser, load_agent_from_file, \
+    strictly_positive_integer
+
+
+def scaled_layout(layout_name, scale):
+    """
+    Tiles the inside of a layout `scale` times in both directions.
+
+    Arguments:
+    ----------
+    - `layout_name`: maze layout (from layout folder).
+    - `scale`: number of copies of the maze along each axis.
+
+    Return:
+    -------
+    - A `Layout` about `scale ** 2` times larger than the original one,
+      without agents.
+    """
+    with open(os.path.join("pacman_module", "layouts",
+                           layout_name + ".lay")) as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    inside = [line[1:-1].replace("P", " ").replace("G", " ")
+              for line in lines[1:-1]]
+    rows = [row * scale for row in inside] * scale
+    border = "%" * (len(rows[0]) + 2)
+    return Layout([border] + ["%" + row + "%" for row in rows] + [border])
+
+
+def wander(layout, position, rng):
+    """
+    Returns a neighbour of `position` drawn uniformly with `rng`.
+    """
+    neighbors = layout.neighbors[position]
+    if not neighbors:
+        return position
+    return neighbors[rng.randint(len(neighbors))][1]
+
+
+def time_filter(agent_class, layout, args, nghosts, steps, seed):
+    """
+    Times `update_belief_state` while tracking ghosts that wander
+    randomly in `layout`, as does Pacman.
+
+    Arguments:
+    ----------
+    - `agent_class`: the `BeliefStateAgent` class to time.
+    - `args`: command-line arguments of `run.py` given to the agent.
+
+    Return:
+    -------
+    - The mean time, in seconds, of an update, and the mean number of
+      positions with a non-zero probability in the belief states.
+    """
+    rng = np.random.RandomState(seed)
+    agent = agent_class(args)
+    agent.walls = layout.walls
+    width, height = layout.width, layout.height
+    agent.beliefGhostStates = np.full(
+        (nghosts, width, height), 1.0 / (width * height))
+    free = [(x, y) for x in range(width) for y in range(height)
+            if not layout.walls[x][y]]
+    ghosts = [free[i] for i in rng.randint(len(free), size=nghosts)]
+    pacman_position = free[rng.randint(len(free))]
+
+    total = 0.
+    support = 0.
+    for _ in range(steps):
+        ghosts = [wander(layout, ghost, rng) for ghost in ghosts]
+        pacman_position = wander(layout, pacman_position, rng)
+        evidences = [abs(x - pacman_position[0]) + abs(y - pacman_position[1])
+                     + rng.normal(scale=np.sqrt(args.sensorvariance))
+                     for x, y in ghosts]
+        t = time.time()
+        beliefStates = agent.update_belief_state(evidences, pacman_position)
+        total += time.time() - t
+        support += np.count_nonzero(beliefStates) / float(nghosts)
+    return total / steps, support / steps
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python filterbench.py <options> <agent_options>
+    EXAMPLES:   (1) python filterbench.py --scales 1 4 7 10
+                    - times the belief state update on mazes made of
+                      1, 16, 49 and 100 copies of large_filter
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        '--bsagentfile',
+        help='Python file containing a `BeliefStateAgent` class.',
+        default="bayesfilter.py")
+    parser.add_argument(
+        '--layout',
+        help='Maze layout (from layout folder) to scale up.',
+        default="large_filter")
+    parser.add_argument(
+        '--scales',
+        help='Number of copies of the maze along each axis.',
+        nargs='+', type=strictly_positive_integer, default=[1, 2, 4, 7, 10])
+    parser.add_argument(
+        '--nghosts',
+        help='Number of ghosts tracked.',
+        type=strictly_positive_integer, default=1)
+    parser.add_argument(
+        '--steps',
+        help='Number of updates timed per maze.',
+        type=strictly_positive_integer, default=20)
+    parser.add_argument(
+        '--seed',
+        help='Seed for random number generator',
+        type=int,
+        default=1)
+
+    args, game_argv = parser.parse_known_args()
+    # The agent is given the options of run.py (--ghostagent, ...)
+    agent_args = build_parser().parse_args(game_argv)
+
+    agent_class = load_agent_from_file(args.bsagentfile, "BeliefStateAgent")
+    print("scale;width;height;free cells;support;seconds per update;"
+          "microseconds per free cell")
+    for scale in args.scales:
+        layout = scaled_layout(args.layout, scale)
+        free_cells = layout.width * layout.height - layout.walls.count()
+        seconds, support = time_filter(agent_class, layout, agent_args,
+                                       args.nghosts, args.steps, args.seed)
+        print("%d;%d;%d;%d;%.1f;%.6f;%.4f" % (
+            scale, layout.width, layout.height, free_cells, support,
+            seconds, 1e6 * seconds / free_cells))
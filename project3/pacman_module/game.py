@@ -26,6 +26,7 @@ import os
 import traceback
 import sys
 import pacman_module as pacmodule
+import random
 import numpy as np
 from copy import deepcopy
 
@@ -317,6 +318,160 @@ class Grid:
         return bools
 
 
+class BitGrid(Grid):
+    """
+    A boolean Grid backed by a single integer bitmask instead of a list of
+    lists.  Cell (x,y) is stored in bit x * height + y, which is also the
+    order in which Grid.__hash__ folds its cells, so both representations
+    hash identically.
+
+    Reading and writing through grid[x][y] keeps working, but copying,
+    counting and hashing no longer need to walk every cell.
+    """
+
+    def __init__(self, width, height, initialValue=False, bits=0):
+        if initialValue not in [False, True]:
+            raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        if initialValue:
+            bits = (1 << (width * height)) - 1
+        self.bits = bits
+
+    def fromGrid(grid):
+        """
+        Builds a BitGrid holding the same cells as any Grid.
+        """
+        bits = 0
+        for x in range(grid.width):
+            for y in range(grid.height):
+                if grid[x][y]:
+                    bits |= 1 << (x * grid.height + y)
+        return BitGrid(grid.width, grid.height, bits=bits)
+    fromGrid = staticmethod(fromGrid)
+
+    @property
+    def data(self):
+        return [[self.isSet(x, y) for y in range(self.height)]
+                for x in range(self.width)]
+
+    def isSet(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def setCell(self, x, y, value):
+        if value:
+            self.bits |= 1 << (x * self.height + y)
+        else:
+            self.bits &= ~(1 << (x * self.height + y))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.width
+        if i < 0 or i >= self.width:
+            raise IndexError('BitGrid column index out of range')
+        return _BitGridColumn(self, i)
+
+    def __setitem__(self, key, item):
+        for y, value in enumerate(item):
+            self.setCell(key, y, value)
+
+    def __eq__(self, other):
+        if other is None:
+            return False
+        if isinstance(other, BitGrid):
+            return self.height == other.height and self.bits == other.bits
+        return self.data == other.data
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def copy(self):
+        return BitGrid(self.width, self.height, bits=self.bits)
+
+    def shallowCopy(self):
+        # The mask is an immutable int, so sharing it is already safe
+        return self.copy()
+
+    def count(self, item=True):
+        n = bin(self.bits).count('1')
+        return n if item else self.width * self.height - n
+
+    def asList(self, key=True):
+        if not key:
+            return Grid.asList(self, key)
+        list = []
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            list.append(divmod(low.bit_length() - 1, self.height))
+            bits ^= low
+        return list
+
+
+class _BitGridColumn:
+    """
+    The grid[x] view of a BitGrid, so that grid[x][y] reads and writes bits.
+    """
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __len__(self):
+        return self.grid.height
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += self.grid.height
+        if y < 0 or y >= self.grid.height:
+            raise IndexError('BitGrid row index out of range')
+        return self.grid.isSet(self.x, y)
+
+    def __setitem__(self, y, value):
+        if y < 0:
+            y += self.grid.height
+        self.grid.setCell(self.x, y, value)
+
+
+# Random 64-bit keys of the state features hashed by GameStateData, drawn
+# lazily from a private generator so that the game's own random stream
+# is left untouched
+ZOBRIST_KEYS = {}
+_ZOBRIST_RANDOM = random.Random(0)
+
+
+def zobristKey(*feature):
+    """
+    Returns the Zobrist key of a state feature, e.g. ('food', x, y).
+    """
+    try:
+        return ZOBRIST_KEYS[feature]
+    except KeyError:
+        key = ZOBRIST_KEYS[feature] = _ZOBRIST_RANDOM.getrandbits(64)
+        return key
+
+
+def freezeBeliefStates(beliefStates):
+    """
+    Returns a read-only copy of `beliefStates`, as a Z*N*M array.  Belief
+    states are shared by all the states derived from the one they were set
+    in, so that generating a state does not copy them.
+
+    Array-likes other than lists and arrays (such as the belief states of
+    the sparse filter) are read-only views expanded on use: they are kept
+    as they are, so that storing them does not expand them.
+    """
+    if not isinstance(beliefStates, (list, tuple, np.ndarray)) and \
+            hasattr(beliefStates, '__array__'):
+        return beliefStates
+    frozen = np.array(beliefStates, dtype=float)
+    frozen.setflags(write=False)
+    return frozen
+
+
 def reconstituteGrid(bitRep):
     if not isinstance(bitRep, type((1, 2))):
         return bitRep
@@ -431,10 +586,12 @@ class GameStateData:
             self.capsules = prevState.capsules[:]
             self.agentStates = self.copyAgentStates(prevState.agentStates)
             self.layout = prevState.layout
+            self.profile = prevState.profile
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self._zobrist = prevState._zobrist
             try:
-                self.beliefStates = np.copy(prevState.beliefStates)
+                self.beliefStates = prevState.beliefStates
             except BaseException:
                 pass
 
@@ -449,15 +606,10 @@ class GameStateData:
     def deepCopy(self):
         state = GameStateData(self)
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
-        try:
-            state.beliefStates = np.copy(self.beliefStates)
-        except BaseException:
-            pass
         return state
 
     def copyAgentStates(self, agentStates):
@@ -486,28 +638,44 @@ class GameStateData:
     def __hash__(self):
         """
         Allows states to be keys of dictionaries.
+
+        The food, capsules and agent states are folded into a Zobrist hash
+        that the game rules update incrementally, see toggleFoodHash,
+        toggleCapsuleHash and toggleAgentHash.
         """
-        for i, state in enumerate(self.agentStates):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                # hash(state)
-        return int(
-            (hash(
-                tuple(
-                    self.agentStates)) +
-                13 *
-                hash(
-                self.food) +
-                113 *
-                hash(
-                tuple(
-                    self.capsules)) +
-                7 *
-                hash(
-                self.score)) %
-            1048575)
+        return self._zobrist ^ hash(self.score)
+
+    def toggleFoodHash(self, x, y):
+        self._zobrist ^= zobristKey('food', x, y)
+
+    def toggleCapsuleHash(self, position):
+        self._zobrist ^= zobristKey('capsule', position)
+
+    def toggleAgentHash(self, agentIndex):
+        """
+        XORs the key of an agent state in or out of the hash.  Call it
+        before and after changing the configuration or scared timer of
+        the agent.
+        """
+        agentState = self.agentStates[agentIndex]
+        configuration = agentState.configuration
+        self._zobrist ^= zobristKey('agent', agentIndex,
+                                    configuration.pos,
+                                    configuration.direction,
+                                    agentState.scaredTimer)
+
+    def rehash(self):
+        """
+        Recomputes the hash from scratch, e.g. after editing the state data
+        without going through the game rules.
+        """
+        self._zobrist = 0
+        for x, y in self.food.asList():
+            self.toggleFoodHash(x, y)
+        for position in self.capsules:
+            self.toggleCapsuleHash(position)
+        for agentIndex in range(len(self.agentStates)):
+            self.toggleAgentHash(agentIndex)
 
     def __str__(self):
         width, height = self.layout.width, self.layout.height
@@ -608,7 +776,8 @@ class GameStateData:
             """
             Create a uniform prior on the belief state
             """
-            uniformBelief = np.full((self.layout.width,
+            uniformBelief = np.full((numGhosts,
+                                     self.layout.width,
                                      self.layout.height),
                                     1.0 / (self.layout.width * self.layout.height))
             agtState = AgentState(
@@ -617,8 +786,93 @@ class GameStateData:
                              (-1, -1), False),
                 -1)
             self.agentStates.append(agtState)
-            self.beliefStates = [np.copy(uniformBelief)
-                                 for _ in range(numGhosts)]
+            self.beliefStates = freezeBeliefStates(uniformBelief)
+        self.rehash()
+
+
+class ExploredStates:
+    """
+    Opt-in record of the states generated during a game.
+
+    At most `capacity` distinct states are kept.  Once the store is full, it
+    holds a uniform reservoir sample of every distinct state offered to it.
+    With a `sampleRate` below 1, each state is only offered with that
+    probability, which bounds the hashing cost as well as the memory.
+    """
+
+    def __init__(self, capacity=10000, sampleRate=1.0, seed=0):
+        if capacity <= 0:
+            raise ValueError("capacity must be > 0")
+        if not 0 < sampleRate <= 1:
+            raise ValueError("sampleRate must be in (0, 1]")
+        self.capacity = capacity
+        self.sampleRate = sampleRate
+        self.random = random.Random(seed)
+        self.clear()
+
+    def clear(self):
+        self.states = []
+        self.positions = {}
+        self.offered = 0
+        self.generated = 0
+
+    def add(self, state):
+        self.generated += 1
+        if self.sampleRate < 1 and self.random.random() >= self.sampleRate:
+            return
+        if state in self.positions:
+            return
+        self.offered += 1
+        if len(self.states) < self.capacity:
+            self.positions[state] = len(self.states)
+            self.states.append(state)
+            return
+        # Reservoir sampling: keep the new state with probability
+        # capacity / offered, in place of a uniformly chosen one
+        i = self.random.randrange(self.offered)
+        if i < self.capacity:
+            del self.positions[self.states[i]]
+            self.positions[state] = i
+            self.states[i] = state
+
+    def asSet(self):
+        return set(self.states)
+
+    def footprint(self):
+        """
+        Returns an estimate, in bytes, of the memory held by the store.  The
+        layout, shared by every state of a game, is not counted, and belief
+        states shared by several states are counted once.
+        """
+        size = sys.getsizeof(self.states) + sys.getsizeof(self.positions)
+        beliefs = {}
+        for state in self.states:
+            data = state.data
+            size += sys.getsizeof(state) + sys.getsizeof(state.__dict__)
+            size += sys.getsizeof(data) + sys.getsizeof(data.__dict__)
+            size += sys.getsizeof(data.agentStates)
+            for agentState in data.agentStates:
+                size += sys.getsizeof(agentState)
+                size += sys.getsizeof(agentState.configuration)
+            if hasattr(data, 'beliefStates'):
+                beliefs[id(data.beliefStates)] = data.beliefStates
+        for beliefStates in beliefs.values():
+            size += sys.getsizeof(beliefStates)
+        return size
+
+    def report(self):
+        return "%d of %d distinct states kept (%d generated), ~%.1f KiB" % (
+            len(self.states), self.offered, self.generated,
+            self.footprint() / 1024.)
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, state):
+        return state in self.positions
+
+    def __iter__(self):
+        return iter(self.states)
 
 
 try:
@@ -712,7 +966,7 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            observation = self.state.deepCopy()
+            observation = self.state.getObservation()
             # Solicit an action
             action = None
             self.mute(agentIndex)
@@ -759,6 +1013,11 @@ class Game:
             if _BOINC_ENABLED:
                 boinc.set_fraction_done(self.getProgress())
 
+        # Inform the agents of the end of the game
+        for agent in self.agents:
+            if hasattr(agent, "final"):
+                agent.final(self.state)
+
         totalScore = self.state.getScore()
 
         self.display.finish()
@@ -43,6 +43,9 @@ from .game import GameStateData
 from .game import Game
 from .game import Directions
 from .game import Actions
+from .game import Configuration
+from .game import ExploredStates
+from .game import freezeBeliefStates
 from .util import nearestPoint
 from .util import manhattanDistance
 from . import textDisplay, graphicsDisplay
@@ -79,8 +82,9 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions
-    explored = set()
+    # static variable keeps track of the generated states; None unless
+    # tracking was turned on with GameState.trackExplored
+    explored = None
     # static variable keeps track of number of calls of
     # /!\ XXX: Do NOT modify this variable during get_action call.
     # /!\ Otherwise, your project won't be graded
@@ -93,12 +97,33 @@ class GameState:
     def setMaximumExpanded(m):
         GameState.maximumExpanded = m
 
+    def trackExplored(capacity=10000, sampleRate=1.0):
+        """
+        Starts recording the generated states in a bounded store (see
+        game.ExploredStates).  Tracking is off by default, so that normal
+        games keep no reference to the states they generate.
+        """
+        GameState.explored = ExploredStates(capacity, sampleRate)
+    trackExplored = staticmethod(trackExplored)
+
+    def stopTrackingExplored():
+        GameState.explored = None
+    stopTrackingExplored = staticmethod(stopTrackingExplored)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
+        if GameState.explored is None:
+            return set()
+        tmp = GameState.explored.asSet()
+        GameState.explored.clear()
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def getExploredReport():
+        if GameState.explored is None:
+            return "explored state tracking disabled"
+        return GameState.explored.report()
+    getExploredReport = staticmethod(getExploredReport)
+
     def getLegalActions(self, agentIndex=0):
         """
         Returns the legal actions for the agent specified.
@@ -110,7 +135,8 @@ class GameState:
         if agentIndex == 0:  # Pacman is moving
             return PacmanRules.getLegalActions(self)
         else:
-            return GhostRules.getLegalActions(self, agentIndex)
+            return self.data.profile.ghostRules.getLegalActions(
+                self, agentIndex)
 
     def isLegalAction(self, agentIndex=0, action=Directions.STOP):
         """
@@ -126,7 +152,8 @@ class GameState:
         if agentIndex == 0:  # Pacman is moving
             return action in PacmanRules.getLegalActions(self)
         else:
-            return action in GhostRules.getLegalActions(self, agentIndex)
+            return action in self.data.profile.ghostRules.getLegalActions(
+                self, agentIndex)
 
     def generateSuccessor(self, agentIndex, action):
         """
@@ -139,34 +166,10 @@ class GameState:
         # Copy current state
         state = GameState(self)
 
-        # Let agent's logic deal with its action's effects on the board
-        if agentIndex == 0:  # Pacman is moving
-            if "beliefStates" not in dir(state.data):
-                state.data._eaten = [
-                    False for i in range(
-                        state.getNumAgents())]
-            PacmanRules.applyAction(state, action)
-        # A ghost is moving
-        elif state.data.agentStates[agentIndex].agtType > 0:
-            GhostRules.applyAction(state, action, agentIndex)
-        else:
-            # Belief state replacement
-            state.data.beliefStates = action
-
-        # Time passes
-        if agentIndex == 0:
-            state.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
-        else:
-            GhostRules.decrementTimer(state.data.agentStates[agentIndex])
-
-        # Resolve multi-agent effects
-        GhostRules.checkDeath(state, agentIndex)
-
-        # Book keeping
-        state.data._agentMoved = agentIndex
-        state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        state.applyRules(agentIndex, action)
+        if GameState.explored is not None:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions(self):
@@ -200,6 +203,64 @@ class GameState:
         return [(self.generateSuccessor(index, action), action)
                 for action in self.getLegalActions(index) if action != Directions.STOP]
 
+    def expandActions(self, agentIndex=0):
+        """
+        Counts one node expansion, as generatePacmanSuccessors and
+        generateGhostSuccessors do, and returns the moves to explore from
+        this state with apply/undo.  Returns None once the node expansion
+        budget is spent.
+        """
+        if (GameState.countExpanded >= GameState.maximumExpanded):
+            return None
+        GameState.countExpanded += 1
+        return [action for action in self.getLegalActions(agentIndex)
+                if action != Directions.STOP]
+
+    def apply(self, agentIndex, action):
+        """
+        Turns this state into its successor after the specified agent takes
+        the action, without allocating a new state.  The change is recorded
+        so that undo() can revert it, which lets depth-first searches walk
+        the game tree on a single mutable state.  As generateSuccessor does,
+        it records the state and its successor when the generated states
+        are tracked, as copies since this state keeps changing.
+        """
+        if self.isWin() or self.isLose():
+            raise Exception('Can\'t generate a successor of a terminal state.')
+
+        # Record the fields the rules may replace, then give the rules
+        # private copies of the lists they edit in place
+        self._ensurePrivateData()
+        data = self.data
+        self._undoStack.append((
+            data.__dict__.copy(),
+            [(agentState.configuration, agentState.scaredTimer)
+             for agentState in data.agentStates]))
+        data.capsules = data.capsules[:]
+        data._eaten = data._eaten[:]
+
+        data._foodEaten = None
+        data._foodAdded = None
+        data._capsuleEaten = None
+        data._agentMoved = None
+        data.scoreChange = 0
+        if GameState.explored is not None:
+            GameState.explored.add(self.deepCopy())
+        self.applyRules(agentIndex, action)
+        if GameState.explored is not None:
+            GameState.explored.add(self.deepCopy())
+
+    def undo(self):
+        """
+        Reverts the last move made with apply().
+        """
+        fields, agents = self._undoStack.pop()
+        self.data.__dict__ = fields
+        for agentState, (configuration, scaredTimer) in zip(
+                self.data.agentStates, agents):
+            agentState.configuration = configuration
+            agentState.scaredTimer = scaredTimer
+
     def getPacmanState(self):
         """
         Returns an AgentState object for pacman (in game.py)
@@ -213,12 +274,18 @@ class GameState:
         return self.data.agentStates[0].getPosition()
 
     def getGhostStates(self):
-        return list(filter(lambda x: x.agtType ==
-                           1, self.data.agentStates[1:]))
+        ghostStates = [s for s in self.data.agentStates[1:]
+                       if s.agtType == 1]
+        if self._copyOnWrite:
+            # Shared with the game: the agent gets copies
+            return [ghostState.copy() for ghostState in ghostStates]
+        return ghostStates
 
     def getGhostState(self, agentIndex):
         if agentIndex == 0 or agentIndex >= self.getNumAgents():
             raise Exception("Invalid index passed to getGhostState")
+        if self._copyOnWrite:
+            return self.data.agentStates[agentIndex].copy()
         return self.data.agentStates[agentIndex]
 
     def getGhostPosition(self, agentIndex):
@@ -233,14 +300,20 @@ class GameState:
 
     def getGhostPositions(self):
         return [tuple(map(int, s.getPosition()))
-                for s in self.getGhostStates()]
+                for s in self.data.agentStates[1:] if s.agtType == 1]
 
     def getGhostDirections(self):
         return [tuple(map(int, s.getDirection()))
-                for s in self.getGhostStates()]
+                for s in self.data.agentStates[1:] if s.agtType == 1]
 
     def getGhostBeliefStates(self):
-        return np.copy(self.data.beliefStates)
+        """
+        Returns the belief states as a read-only Z*N*M array, shared with
+        the other states of the game (or as the read-only array-like the
+        belief state agent returned, see `freezeBeliefStates`:
+        `np.asarray` expands it).
+        """
+        return self.data.beliefStates
 
     def getNoisyGhostDistances(self):
         ghosts_pos = self.getGhostPositions()
@@ -265,6 +338,8 @@ class GameState:
         """
         Returns a list of positions (x,y) of the remaining capsules.
         """
+        if self._copyOnWrite:
+            return self.data.capsules[:]
         return self.data.capsules
 
     def getNumFood(self):
@@ -280,6 +355,8 @@ class GameState:
         currentFood = state.getFood()
         if currentFood[x][y] == True: ...
         """
+        if self._copyOnWrite:
+            return self.data.food.copy()
         return self.data.food
 
     def getWalls(self):
@@ -292,10 +369,12 @@ class GameState:
         walls = state.getWalls()
         if walls[x][y] == True: ...
         """
+        if self._copyOnWrite:
+            return self.data.layout.walls.copy()
         return self.data.layout.walls
 
     def hasFood(self, x, y):
-        return self.data.food[x][y]
+        return self.data.food.isSet(x, y)
 
     def hasWall(self, x, y):
         return self.data.layout.walls[x][y]
@@ -319,6 +398,65 @@ class GameState:
             self.data = GameStateData(prevState.data)
         else:
             self.data = GameStateData()
+        self._undoStack = []
+        self._copyOnWrite = False
+
+    def getObservation(self):
+        """
+        Returns a view of this state to hand to an agent.  The view shares
+        the data of this state instead of copying it: the data is only
+        copied if the agent edits the view in place with apply(), and the
+        accessors of the view return copies of the food, capsules, walls
+        and ghost states, so that the agent cannot change the game through
+        them.
+        """
+        observation = GameState.__new__(GameState)
+        observation.data = self.data
+        observation._undoStack = []
+        observation._copyOnWrite = True
+        return observation
+
+    def _ensurePrivateData(self):
+        # Called before any in-place edit: a view stops sharing its data
+        if self._copyOnWrite:
+            self.data = self.data.deepCopy()
+            self._copyOnWrite = False
+
+    def applyRules(self, agentIndex, action):
+        """
+        Edits this state in place to reflect the results of the action.
+        """
+        self._ensurePrivateData()
+        profile = self.data.profile
+
+        # Let agent's logic deal with its action's effects on the board
+        if agentIndex == 0:  # Pacman is moving
+            if profile.resetEaten:
+                self.data._eaten = [
+                    False for i in range(
+                        self.getNumAgents())]
+            PacmanRules.applyAction(self, action)
+        # A ghost is moving
+        elif self.data.agentStates[agentIndex].agtType > 0:
+            profile.ghostRules.applyAction(self, action, agentIndex)
+        else:
+            # Belief state replacement
+            self.data.beliefStates = freezeBeliefStates(action)
+
+        # Time passes
+        if agentIndex == 0:
+            self.data.scoreChange += -TIME_PENALTY  # Penalty for waiting around
+        else:
+            self.data.toggleAgentHash(agentIndex)
+            GhostRules.decrementTimer(self.data.agentStates[agentIndex])
+            self.data.toggleAgentHash(agentIndex)
+
+        # Resolve multi-agent effects
+        profile.checkDeath(self, agentIndex)
+
+        # Book keeping
+        self.data._agentMoved = agentIndex
+        self.data.score += self.data.scoreChange
 
     def deepCopy(self):
         state = GameState(self)
@@ -347,9 +485,12 @@ class GameState:
             numGhostAgents=1000,
             hiddenGhosts=False,
             edibleGhosts=False,
-            beliefStateAgent=None):
+            beliefStateAgent=None,
+            profile=None):
         """
-        Creates an initial game state from a layout array (see layout.py).
+        Creates an initial game state from a layout array (see layout.py),
+        played with the rules of `profile` (see getRulesProfile), those of
+        the adversarial game by default.
         """
         self.data.initialize(
             layout,
@@ -357,6 +498,7 @@ class GameState:
             isGhostVisible=not hiddenGhosts,
             edibleGhosts=edibleGhosts,
             beliefStateAgent=beliefStateAgent)
+        self.data.profile = ADVERSARIAL_PROFILE if profile is None else profile
 
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
@@ -391,13 +533,17 @@ class ClassicGameRules:
 
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()] + \
             ([beliefStateAgent] if beliefStateAgent is not None else [])
+        profile = getRulesProfile(
+            min(len(ghostAgents), layout.getNumGhosts()),
+            beliefStateAgent is not None)
         initState = GameState()
         initState.initialize(
             layout,
             len(ghostAgents),
             hiddenGhosts=hiddenGhosts,
             edibleGhosts=edibleGhosts,
-            beliefStateAgent=beliefStateAgent)
+            beliefStateAgent=beliefStateAgent,
+            profile=profile)
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
         self.initialState = initState.deepCopy()
@@ -459,9 +605,8 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions(
-            state.getPacmanState().configuration,
-            state.data.layout.walls)
+        return state.data.layout.getLegalActions(
+            state.data.agentStates[0].configuration)
     getLegalActions = staticmethod(getLegalActions)
 
     def applyAction(state, action):
@@ -476,8 +621,10 @@ class PacmanRules:
 
         # Update Configuration
         vector = Actions.directionToVector(action, PacmanRules.PACMAN_SPEED)
+        state.data.toggleAgentHash(0)
         pacmanState.configuration = pacmanState.configuration.generateSuccessor(
             vector)
+        state.data.toggleAgentHash(0)
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -490,12 +637,12 @@ class PacmanRules:
     def consume(position, state):
         x, y = position
         # Eat food
-        if state.data.food[x][y]:
+        if state.data.food.isSet(x, y):
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.food.setCell(x, y, False)
+            state.data.toggleFoodHash(x, y)
             state.data._foodEaten = position
-            # TODO: cache numFood?
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
@@ -503,10 +650,13 @@ class PacmanRules:
         # Eat capsule
         if(position in state.getCapsules()):
             state.data.capsules.remove(position)
+            state.data.toggleCapsuleHash(position)
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range(1, len(state.data.agentStates)):
+                state.data.toggleAgentHash(index)
                 state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.toggleAgentHash(index)
     consume = staticmethod(consume)
 
 
@@ -522,17 +672,7 @@ class GhostRules:
         reach a dead end, but can turn 90 degrees at intersections.
         """
         conf = state.getGhostState(ghostIndex).configuration
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
-        if Directions.STOP in possibleActions and "beliefStates" not in dir(
-                state.data):
-            possibleActions.remove(Directions.STOP)
-        if "beliefStates" not in dir(
-                state.data) and reverse in possibleActions and len(possibleActions) > 1:
-            possibleActions.remove(reverse)
-
-        return possibleActions
+        return state.data.layout.getGhostActions(conf)
     getLegalActions = staticmethod(getLegalActions)
 
     def getLegalActionsAtPositionAndDirection(
@@ -541,19 +681,8 @@ class GhostRules:
         Ghosts cannot stop, and cannot turn around unless they
         reach a dead end, but can turn 90 degrees at intersections.
         """
-        conf = deepcopy(state.getGhostState(ghostIndex).configuration)
-        conf.pos = position
-        conf.direction = direction
-        possibleActions = Actions.getPossibleActions(
-            conf, state.data.layout.walls)
-        reverse = Actions.reverseDirection(conf.direction)
-        if Directions.STOP in possibleActions:
-            possibleActions.remove(Directions.STOP)
-        if "beliefStates" not in dir(
-                state.data) and reverse in possibleActions and len(possibleActions) > 1:
-            possibleActions.remove(reverse)
-
-        return possibleActions
+        return state.data.layout.getGhostActions(
+            Configuration(position, direction))
     getLegalActionsAtPositionAndDirection = staticmethod(
         getLegalActionsAtPositionAndDirection)
 
@@ -565,55 +694,54 @@ class GhostRules:
 
         ghostState = state.data.agentStates[ghostIndex]
         speed = GhostRules.GHOST_SPEED
-        if ghostState.scaredTimer > 0 and "beliefStates" not in dir(state.data):
+        if ghostState.scaredTimer > 0:
             speed /= 2.0
         vector = Actions.directionToVector(action, speed)
+        state.data.toggleAgentHash(ghostIndex)
         ghostState.configuration = ghostState.configuration.generateSuccessor(
             vector)
+        state.data.toggleAgentHash(ghostIndex)
     applyAction = staticmethod(applyAction)
 
     def decrementTimer(ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint(
-                ghostState.configuration.pos)
+            # Configurations are shared between successive states, so
+            # replace it rather than snapping the position in place
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration(
+                nearestPoint(configuration.pos),
+                configuration.direction,
+                configuration.visible)
         ghostState.scaredTimer = max(0, timer - 1)
     decrementTimer = staticmethod(decrementTimer)
 
     def checkDeath(state, agentIndex):
         pacmanPosition = state.getPacmanPosition()
+        collide = state.data.profile.ghostRules.collide
         if agentIndex == 0:  # Pacman just moved; Anyone can kill him
             for index in range(1, len(state.data.agentStates)):
                 if state.data.agentStates[index].agtType != -1:
                     ghostState = state.data.agentStates[index]
                     ghostPosition = ghostState.configuration.getPosition()
                     if GhostRules.canKill(pacmanPosition, ghostPosition):
-                        GhostRules.collide(state, ghostState, index)
+                        collide(state, ghostState, index)
         elif state.data.agentStates[agentIndex].agtType != -1:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill(pacmanPosition, ghostPosition):
-                GhostRules.collide(state, ghostState, agentIndex)
+                collide(state, ghostState, agentIndex)
     checkDeath = staticmethod(checkDeath)
 
     def collide(state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(
-                state,
-                ghostState,
-                agentIndex,
-                delete="beliefStates" in dir(
-                    state.data))
-            state.data._eaten[agentIndex] = True
-            if "beliefStates" not in dir(state.data):
-                ghostState.scaredTimer = 0
-            else:
-                if np.all(state.data._eaten[1:]) and not state.data._lose:
-                    state.data.scoreChange += 500
-                    state.data._win = True
+            state.data.toggleAgentHash(agentIndex)
+            GhostRules.placeGhost(state, ghostState, agentIndex)
+            ghostState.scaredTimer = 0
+            state.data.toggleAgentHash(agentIndex)
             # Added for first-person
-
+            state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
                 state.data.scoreChange -= 500
@@ -635,6 +763,102 @@ class GhostRules:
             ghostState.configuration = voidConfiguration
     placeGhost = staticmethod(placeGhost)
 
+
+class BeliefGhostRules(GhostRules):
+    """
+    Ghost rules of the belief-tracking games: ghosts may stop and turn
+    around, keep their speed while edible and leave the maze once eaten.
+    Pacman wins when every ghost has been eaten.
+    """
+
+    def getLegalActions(state, ghostIndex):
+        conf = state.getGhostState(ghostIndex).configuration
+        return state.data.layout.getLegalActions(conf)
+    getLegalActions = staticmethod(getLegalActions)
+
+    def getLegalActionsAtPositionAndDirection(
+            state, ghostIndex, position, direction):
+        legal = state.data.layout.getLegalActions(
+            Configuration(position, direction))
+        return [action for action in legal if action != Directions.STOP]
+    getLegalActionsAtPositionAndDirection = staticmethod(
+        getLegalActionsAtPositionAndDirection)
+
+    def applyAction(state, action, ghostIndex):
+
+        legal = BeliefGhostRules.getLegalActions(state, ghostIndex)
+        if action not in legal:
+            raise Exception("Illegal ghost action " + str(action))
+
+        ghostState = state.data.agentStates[ghostIndex]
+        vector = Actions.directionToVector(action, GhostRules.GHOST_SPEED)
+        state.data.toggleAgentHash(ghostIndex)
+        ghostState.configuration = ghostState.configuration.generateSuccessor(
+            vector)
+        state.data.toggleAgentHash(ghostIndex)
+    applyAction = staticmethod(applyAction)
+
+    def collide(state, ghostState, agentIndex):
+        if ghostState.scaredTimer > 0:
+            state.data.scoreChange += 200
+            state.data.toggleAgentHash(agentIndex)
+            GhostRules.placeGhost(state, ghostState, agentIndex, delete=True)
+            state.data.toggleAgentHash(agentIndex)
+            state.data._eaten[agentIndex] = True
+            if np.all(state.data._eaten[1:]) and not state.data._lose:
+                state.data.scoreChange += 500
+                state.data._win = True
+        else:
+            if not state.data._win:
+                state.data.scoreChange -= 500
+                state.data._lose = True
+    collide = staticmethod(collide)
+
+
+class RulesProfile:
+    """
+    The rule functions of one variant of the game.  The profile is chosen
+    once per game by ClassicGameRules.newGame, passed to
+    GameState.initialize and shared by every state of the game, so the
+    rules never have to inspect a state to find out which variant is being
+    played.
+    """
+
+    def __init__(self, name, ghostRules, checkDeath, resetEaten=True):
+        self.name = name
+        self.ghostRules = ghostRules
+        self.checkDeath = checkDeath
+        self.resetEaten = resetEaten
+
+    def __str__(self):
+        return self.name
+
+
+def _checkNoDeath(state, agentIndex):
+    # Without ghosts, nobody can die
+    pass
+
+
+CLASSIC_SEARCH_PROFILE = RulesProfile(
+    'classic search', GhostRules, _checkNoDeath)
+ADVERSARIAL_PROFILE = RulesProfile(
+    'adversarial', GhostRules, GhostRules.checkDeath)
+BELIEF_TRACKING_PROFILE = RulesProfile(
+    'belief tracking', BeliefGhostRules, GhostRules.checkDeath,
+    resetEaten=False)
+
+
+def getRulesProfile(numGhosts, beliefTracking=False):
+    """
+    Chooses the rules profile of a game with `numGhosts` ghosts, whose
+    belief states are tracked by an agent if `beliefTracking`.
+    """
+    if beliefTracking:
+        return BELIEF_TRACKING_PROFILE
+    if numGhosts == 0:
+        return CLASSIC_SEARCH_PROFILE
+    return ADVERSARIAL_PROFILE
+
 #############################
 # FRAMEWORK TO START A GAME #
 #############################
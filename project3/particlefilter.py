@@ -0,0 +1,179 @@
+# Particle filter alternative to the exact filter of bayesfilter.py
+
+import numpy as np
+
+import bayesfilter
+
+
+class BeliefStateAgent(bayesfilter.BeliefStateAgent):
+    """
+    Tracks the ghosts with a particle filter: each ghost is followed by
+    `args.nparticles` particles moved with the transition model of the
+    exact filter, weighted by the same sensor model and resampled with
+    systematic resampling. The cost of a step depends on the number of
+    particles rather than on the size of the maze.
+
+    The particles are drawn from a generator of the agent, seeded with
+    `args.seed`, so that they do not consume the random numbers of the
+    game (the noise of the evidences, the moves of the ghosts).
+    """
+
+    def __init__(self, args):
+        """
+        Arguments:
+        ----------
+        - `args`: Namespace of arguments from command-line prompt.
+        """
+        super().__init__(args)
+
+        # Z*P flat indices of the positions of the particles
+        self.particles = None
+        self.nparticles = self.args.nparticles
+
+        # Generator of the particles, unseeded for a negative seed
+        seed = getattr(self.args, 'seed', -1)
+        self.rng = np.random.default_rng(seed if seed >= 0 else None)
+
+    def update_belief_state(self, evidences, pacman_position):
+        """
+        Given a list of (noised) distances from pacman to ghosts,
+        returns a list of belief states about ghosts positions
+
+        Arguments:
+        ----------
+        - `evidences`: list of distances between
+          pacman and ghosts at state x_{t}
+          where 't' is the current time step
+        - `pacman_position`: 2D coordinates position
+          of pacman at state x_{t}
+          where 't' is the current time step
+
+        Return:
+        -------
+        - A list of Z belief states at state x_{t}
+          as N*M numpy mass probability matrices
+          where N and M are respectively width and height
+          of the maze layout and Z is the number of ghosts.
+
+        N.B. : [0,0] is the bottom left corner of the maze
+        """
+        if self.inner is None:
+            self.initialize_grid()
+        width, height = self.inner.shape
+        if self.particles is None:
+            self.particles = self.sample_particles(
+                np.asarray(self.beliefGhostStates) * self.inner)
+
+        # Transition step: each particle makes one move of the ghost
+        targets, cumulative = self.move_table(pacman_position)
+        totals = cumulative[self.particles, -1]
+        draws = self.rng.random(self.particles.shape) * totals
+        moves = (cumulative[self.particles] <= draws[..., None]).sum(axis=-1)
+        moves = np.minimum(moves, 3)
+        alive = totals > 0
+        self.particles = targets[self.particles, moves]
+
+        # Update step: the weight of each particle is the sensor model of
+        # the exact filter
+        i, j = np.divmod(self.particles, height)
+        distances = np.abs(i - pacman_position[0]) + \
+            np.abs(j - pacman_position[1])
+        dist_diff = distances - np.asarray(evidences)[:, None]
+        weights = 1 - np.abs(dist_diff) / (width + height)
+        weights[weights < 0] = 0.0001
+        weights[~alive] = 0
+
+        beliefStates = self.histogram(weights)
+        self.particles = self.resample(weights)
+
+        self.beliefGhostStates = beliefStates
+        self.counter += 1
+
+        return beliefStates
+
+    def move_table(self, pacman_position):
+        """
+        For a given pacman position, gives the moves of the ghost from
+        each position, read from the transition cache.
+
+        Arguments:
+        ----------
+        - 'pacman_position': 2D coordinates position of pacman
+
+        Return:
+        -------
+        - Two (N*M)*4 matrices: the flat index of the position reached
+          by each move, and the cumulative probabilities of the moves
+        """
+        key = ('moves', self.layout_key, self.ghost_type,
+               tuple(pacman_position))
+
+        def build():
+            height = self.inner.shape[1]
+            cells = np.arange(self.inner.size)
+            moves = self.transition_weights(pacman_position)
+            targets = np.stack([cells + di * height + dj
+                                for (di, dj), _ in moves], axis=1)
+            probs = np.stack([prob.ravel() for _, prob in moves], axis=1)
+            return np.where(probs > 0, targets, cells[:, None]), \
+                np.cumsum(probs, axis=1)
+
+        return self.transitions.get(key, build)
+
+    def sample_particles(self, beliefStates):
+        """
+        Draws the particles of each ghost from a Z*N*M belief state,
+        uniformly over the inner positions when a belief is empty.
+        """
+        flat = beliefStates.reshape(len(beliefStates), -1)
+        particles = np.empty((len(flat), self.nparticles), dtype=int)
+        for k, belief in enumerate(flat):
+            if belief.sum() <= 0:
+                belief = self.inner.ravel().astype(float)
+            particles[k] = self.rng.choice(
+                belief.size, self.nparticles, p=belief / belief.sum())
+        return particles
+
+    def histogram(self, weights):
+        """
+        Returns the Z*N*M belief states given by the weighted particles.
+        """
+        ghosts = len(self.particles)
+        cells = self.inner.size
+        offsets = np.arange(ghosts)[:, None] * cells
+        beliefStates = np.bincount(
+            (self.particles + offsets).ravel(), weights=weights.ravel(),
+            minlength=ghosts * cells).reshape((ghosts,) + self.inner.shape)
+        totals = beliefStates.sum(axis=(1, 2), keepdims=True)
+        # A ghost whose particles all died is lost: back to a uniform belief
+        lost = totals[:, 0, 0] == 0
+        beliefStates[lost] = self.inner
+        totals[lost] = self.inner.sum()
+        return beliefStates / totals
+
+    def resample(self, weights):
+        """
+        Systematic resampling of the particles of all the ghosts at once.
+        """
+        ghosts, n = weights.shape
+        particles = np.empty_like(self.particles)
+        lost = weights.sum(axis=1) == 0
+        if lost.any():
+            particles[lost] = self.sample_particles(
+                np.zeros((lost.sum(),) + self.inner.shape))
+        kept = np.flatnonzero(~lost)
+        if len(kept) == 0:
+            return particles
+
+        # Each ghost gets its own unit interval of the cumulative weights
+        cumulative = np.cumsum(weights[kept], axis=1)
+        cumulative /= cumulative[:, -1:]
+        cumulative[:, -1] = 1
+        offsets = np.arange(len(kept))[:, None]
+        positions = (self.rng.random((len(kept), 1)) + np.arange(n)) / n
+        picks = np.searchsorted((cumulative + offsets).ravel(),
+                                (positions + offsets).ravel(), side='right')
+        picks = picks.reshape(len(kept), n) - offsets * n
+        particles[kept] = np.take_along_axis(
+            self.particles[kept], picks, axis=1)
+        return particles
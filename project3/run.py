@@ -2,7 +2,7 @@ import imp
 import os
 from argparse import ArgumentParser, ArgumentTypeError
 import random
-from pacman_module.pacman import runGame
+from pacman_module.pacman import runGame, GameState
 from pacman_module.ghostAgents import\
     ConfusedGhost, AfraidGhost, ScaredGhost
 import numpy as np
@@ -51,7 +51,8 @@ ghosts["confused"] = ConfusedGhost
 ghosts["afraid"] = AfraidGhost
 ghosts["scared"] = ScaredGhost
 
-if __name__ == '__main__':
+
+def build_parser():
     usage = """
     USAGE:      python run.py <game_options> <agent_options>
     EXAMPLES:   (1) python run.py
@@ -106,16 +107,38 @@ if __name__ == '__main__':
         help='The variance of the sensor estimates.',
         default=1.0,
         type=float)
+    parser.add_argument(
+        '--nparticles',
+        help='Number of particles per ghost of the particle filter.',
+        default=1000,
+        type=strictly_positive_integer)
+    parser.add_argument(
+        '--prunethreshold',
+        help='Probability below which the sparse filter drops a position.',
+        default=1e-4,
+        type=proba_float)
+    parser.add_argument(
+        '--metricsfile',
+        help='CSV file receiving the running belief state metrics.',
+        default="metrics.csv")
+    parser.add_argument(
+        '--metricsflush',
+        help='Number of steps between two summaries of the metrics.',
+        default=1000,
+        type=strictly_positive_integer)
+    parser.add_argument(
+        '--trackexplored',
+        help='Keep up to this many generated states and report their '
+             'memory footprint (instrumentation, off by default).',
+        type=strictly_positive_integer, default=None)
+    return parser
 
-    args = parser.parse_args()
-
-    if args.seed >= 0:
-        np.random.seed(args.seed)
-        random.seed(args.seed)
 
-    if (args.agentfile == "humanagent.py" and args.silentdisplay):
-        print("Human agent cannot play without graphical display")
-        exit()
+def play(args):
+    """
+    Plays the game described by the command-line arguments `args` and
+    returns its total score, computation time and expanded nodes.
+    """
     agent = load_agent_from_file(args.agentfile, "PacmanAgent")(args)
 
     gagt = ghosts[args.ghostagent]
@@ -130,12 +153,32 @@ if __name__ == '__main__':
         bsagt = load_agent_from_file(
             args.bsagentfile, "BeliefStateAgent")(args)
 
-    total_score, total_computation_time, _ = runGame(
+    return runGame(
         layout, agent, gagts, bsagt, not args.silentdisplay, expout=0,
         hiddenGhosts=args.hiddenghosts, edibleGhosts=args.edibleghosts)
 
+
+if __name__ == '__main__':
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.seed >= 0:
+        np.random.seed(args.seed)
+        random.seed(args.seed)
+
+    if (args.agentfile == "humanagent.py" and args.silentdisplay):
+        print("Human agent cannot play without graphical display")
+        exit()
+
+    if args.trackexplored:
+        GameState.trackExplored(args.trackexplored)
+
+    total_score, total_computation_time, _ = play(args)
+
     print("Total score : " + str(total_score))
     print("Total computation time (seconds) : " + str(total_computation_time))
+    if args.trackexplored:
+        print("Explored states : " + GameState.getExploredReport())
     f = open("temp", "w+")
     s, c = total_score, total_computation_time
     f.write(str(s) + ";" + str(c))
@@ -0,0 +1,315 @@
+# Offline forward-backward smoothing and Viterbi decoding of ghost
+# trajectories, with the models of bayesfilter.py
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+import bayesfilter
+from bayesfilter import METRICS, belief_metrics
+from pacman_module.layout import Layout
+from run import build_parser
+from traces import load_traces
+
+
+class Smoother(bayesfilter.BeliefStateAgent):
+    """
+    Estimates the positions of the ghosts from a whole sequence of
+    evidences rather than online: the forward pass is the exact filter,
+    the backward pass brings the evidences of later steps to earlier
+    ones. The sensor model is evaluated for all the steps at once.
+
+    The recursions in time stay sequential: the filter, the smoother and
+    Viterbi take one sparse matrix product per step, for all the ghosts
+    at once. The fixed-lag smoother moves all its windows back together,
+    so that it takes one product per step of lag.
+    """
+
+    def log_predecessors(self, pacman_position):
+        """
+        For a given pacman position, gives the moves of the ghost that lead
+        to each position, read from the transition cache.
+
+        Arguments:
+        ----------
+        - 'pacman_position': 2D coordinates position of pacman
+
+        Return:
+        -------
+        - Two (N*M)*4 matrices: the flat index of the origin of each move
+          leading to a position, and the logarithm of its probability
+          (-inf for the missing moves)
+        """
+        key = ('predecessors', self.layout_key, self.ghost_type,
+               tuple(pacman_position))
+
+        def build():
+            sources, targets, probs = self.transition_matrix(pacman_position)
+            cells = self.inner.size
+            order = np.argsort(targets, kind='stable')
+            sources, targets, probs = \
+                sources[order], targets[order], probs[order]
+            starts = np.cumsum(np.bincount(targets, minlength=cells)) - \
+                np.bincount(targets, minlength=cells)
+            slots = np.arange(len(targets)) - starts[targets]
+            origins = np.zeros((cells, 4), dtype=int)
+            log_probs = np.full((cells, 4), -np.inf)
+            origins[targets, slots] = sources
+            log_probs[targets, slots] = np.log(probs)
+            return origins, log_probs
+
+        return self.transitions.get(key, build)
+
+    def likelihoods(self, evidences, pacman_positions):
+        """
+        Returns the T*Z*(N*M) probabilities of the evidences given each
+        position of the ghosts, 1 outside of the free cells.
+        """
+        evidences = np.asarray(evidences)
+        likelihoods = np.ones(evidences.shape + (self.inner.size,))
+        i, j = self.free_cells
+        likelihoods[..., i * self.inner.shape[1] + j] = self.sensor_model(
+            evidences, pacman_positions)
+        return likelihoods
+
+    def backward_step(self, messages, pacman_position):
+        """
+        Transpose of `predict`: sums, for each position, the Z (N*M)
+        `messages` of the positions the ghost can move to.
+        """
+        key = (self.layout_key, self.ghost_type, tuple(pacman_position))
+        sources, targets, probs = self.transitions.get(
+            key, lambda: self.transition_matrix(pacman_position))
+        flow = messages[:, targets] * probs
+        return np.stack([
+            np.bincount(sources, weights=ghost_flow,
+                        minlength=messages.shape[1])
+            for ghost_flow in flow])
+
+    def step_transitions(self, pacman_positions):
+        """
+        Concatenates the transition matrices of the positions of pacman at
+        each step.
+
+        Arguments:
+        ----------
+        - `pacman_positions`: T*2 coordinates of pacman
+
+        Return:
+        -------
+        - Four arrays over the moves of all the steps, in the order of the
+          steps: the step of each move, the flat index of its origin and
+          of its destination, and its probability
+        """
+        matrices = [self.transitions.get(
+            (self.layout_key, self.ghost_type, tuple(position)),
+            lambda: self.transition_matrix(position))
+            for position in pacman_positions]
+        sizes = [len(matrix[0]) for matrix in matrices]
+        steps = np.repeat(np.arange(len(matrices)), sizes)
+        return (steps,) + tuple(np.concatenate(arrays)
+                                for arrays in zip(*matrices))
+
+    def backward_steps(self, messages, transitions):
+        """
+        `backward_step` for the messages of several steps at once.
+
+        Arguments:
+        ----------
+        - `messages`: S*Z*(N*M) messages of S steps
+        - `transitions`: the moves of these steps, numbered from 0, as
+          given by `step_transitions`
+
+        Return:
+        -------
+        - The S*Z*(N*M) sums of the messages of the positions the ghost
+          can move to
+        """
+        steps, sources, targets, probs = transitions
+        count, ghosts, cells = messages.shape
+        flow = messages[steps, :, targets] * probs[:, None]
+        index = steps * cells + sources
+        return np.stack([
+            np.bincount(index, weights=ghost_flow,
+                        minlength=count * cells).reshape(count, cells)
+            for ghost_flow in flow.T], axis=1)
+
+    def filter(self, evidences, pacman_positions):
+        """
+        Forward pass: the belief states of the exact filter after each
+        step, from a uniform prior.
+
+        Arguments:
+        ----------
+        - `evidences`: T*Z noisy distances between pacman and the ghosts
+        - `pacman_positions`: T*2 coordinates of pacman
+
+        Return:
+        -------
+        - The T*Z*N*M belief states
+        """
+        if self.inner is None:
+            self.initialize_grid()
+        likelihoods = self.likelihoods(evidences, pacman_positions)
+        steps, ghosts, cells = likelihoods.shape
+        alphas = np.empty((steps, ghosts, cells))
+        alpha = np.full((ghosts, cells), 1.0 / cells)
+        for t in range(steps):
+            alpha = self.predict(
+                alpha.reshape((ghosts,) + self.inner.shape),
+                pacman_positions[t]).reshape(ghosts, cells)
+            alpha *= likelihoods[t]
+            alpha /= alpha.sum(axis=1, keepdims=True)
+            alphas[t] = alpha
+        return alphas.reshape((steps, ghosts) + self.inner.shape)
+
+    def smooth(self, evidences, pacman_positions, lag=None):
+        """
+        Forward-backward smoothing.
+
+        Arguments:
+        ----------
+        - `evidences`: T*Z noisy distances between pacman and the ghosts
+        - `pacman_positions`: T*2 coordinates of pacman
+        - `lag`: if given, the belief state at each step only uses the
+          evidences of the next `lag` steps (fixed-lag smoothing), as an
+          online smoother delayed by `lag` steps would
+
+        Return:
+        -------
+        - The T*Z*N*M smoothed belief states
+        """
+        alphas = self.filter(evidences, pacman_positions)
+        steps, ghosts = alphas.shape[:2]
+        alphas = alphas.reshape(steps, ghosts, -1)
+        likelihoods = self.likelihoods(evidences, pacman_positions)
+
+        if lag is None:
+            betas = np.ones_like(alphas)
+            for t in range(steps - 1, 0, -1):
+                beta = self.backward_step(likelihoods[t] * betas[t],
+                                          pacman_positions[t])
+                betas[t - 1] = beta / beta.sum(axis=1, keepdims=True)
+        else:
+            # One backward pass of `lag` steps per step, all the passes
+            # moving together: at the k-th step of lag, the message of step
+            # t is brought back from step t + k
+            steps_of_moves, sources, targets, probs = \
+                self.step_transitions(pacman_positions)
+            betas = np.ones_like(alphas)
+            for k in range(lag, 0, -1):
+                if k >= steps:
+                    continue
+                first = np.searchsorted(steps_of_moves, k)
+                beta = self.backward_steps(
+                    likelihoods[k:] * betas[:steps - k],
+                    (steps_of_moves[first:] - k, sources[first:],
+                     targets[first:], probs[first:]))
+                betas[:steps - k] = beta / beta.sum(axis=2, keepdims=True)
+
+        gammas = alphas * betas
+        gammas /= gammas.sum(axis=2, keepdims=True)
+        return gammas.reshape((steps, ghosts) + self.inner.shape)
+
+    def viterbi(self, evidences, pacman_positions):
+        """
+        Most likely trajectories of the ghosts given all the evidences.
+
+        Arguments:
+        ----------
+        - `evidences`: T*Z noisy distances between pacman and the ghosts
+        - `pacman_positions`: T*2 coordinates of pacman
+
+        Return:
+        -------
+        - The T*Z*2 coordinates of the ghosts along their trajectories
+        """
+        if self.inner is None:
+            self.initialize_grid()
+        with np.errstate(divide='ignore'):
+            log_likelihoods = np.log(
+                self.likelihoods(evidences, pacman_positions))
+        steps, ghosts, cells = log_likelihoods.shape
+        pointers = np.empty((steps, ghosts, cells), dtype=np.int32)
+
+        # The first step starts from the uniform prior, as the filter does
+        delta = np.zeros((ghosts, cells))
+        for t in range(steps):
+            origins, log_probs = self.log_predecessors(pacman_positions[t])
+            scores = delta[:, origins] + log_probs
+            best = scores.argmax(axis=2)
+            pointers[t] = np.take_along_axis(
+                origins[None], best[..., None], axis=2)[..., 0]
+            delta = np.take_along_axis(
+                scores, best[..., None], axis=2)[..., 0] + log_likelihoods[t]
+            delta -= delta.max(axis=1, keepdims=True)
+
+        path = np.empty((steps, ghosts), dtype=int)
+        path[-1] = delta.argmax(axis=1)
+        for t in range(steps - 1, 0, -1):
+            path[t - 1] = pointers[t, np.arange(ghosts), path[t]]
+        return np.stack(np.divmod(path, self.inner.shape[1]), axis=-1)
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python smoothing.py <file> <options> <agent_options>
+    EXAMPLES:   (1) python smoothing.py scared.npz --lags 0 2 5
+                    - compares the filter, fixed-lag smoothers with lags
+                      of 0, 2 and 5 steps, the smoother and the Viterbi
+                      trajectories on games recorded with traces.py
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        'traces',
+        help='File of games recorded with traces.py.')
+    parser.add_argument(
+        '--lags',
+        help='Lags of the fixed-lag smoothers to evaluate.',
+        nargs='*', type=int, default=[])
+
+    args, game_argv = parser.parse_known_args()
+    game_args = build_parser().parse_args(game_argv)
+
+    traces = load_traces(args.traces)
+    game_args.ghostagent = str(traces["ghostagent"])
+    game_args.sensorvariance = float(traces["sensorvariance"])
+    layout = Layout(list(traces["layout"]))
+
+    estimators = [("filter", None)] + \
+        [("lag %d" % lag, lag) for lag in args.lags] + \
+        [("smoother", None), ("viterbi", None)]
+    print("estimator;" + ";".join(METRICS) + ";seconds per step")
+    for name, lag in estimators:
+        metrics = {metric: [] for metric in METRICS}
+        seconds = 0.
+        for g, length in enumerate(traces["lengths"]):
+            smoother = Smoother(game_args)
+            smoother.walls = layout.walls
+            evidences = traces["evidences"][g, :length]
+            pacman_positions = traces["pacman"][g, :length]
+            ghosts = traces["ghosts"][g, :length]
+
+            start = time.time()
+            if name == "filter":
+                beliefStates = smoother.filter(evidences, pacman_positions)
+            elif name == "viterbi":
+                path = smoother.viterbi(evidences, pacman_positions)
+                beliefStates = np.zeros(
+                    ghosts.shape[:2] + (layout.width, layout.height))
+                steps, ghost = np.indices(ghosts.shape[:2])
+                beliefStates[steps, ghost, path[..., 0], path[..., 1]] = 1
+            else:
+                beliefStates = smoother.smooth(evidences, pacman_positions,
+                                               lag)
+            seconds += time.time() - start
+
+            for metric, values in belief_metrics(
+                    beliefStates, ghosts).items():
+                metrics[metric].append(values.ravel())
+
+        means = [np.nanmean(np.concatenate(metrics[m])) for m in METRICS]
+        print(name + "".join(";%.4f" % m for m in means) +
+              ";%.6f" % (seconds / max(traces["lengths"].sum(), 1)))
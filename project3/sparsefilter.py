@@ -0,0 +1,224 @@
+# Sparse, log-space alternative to the exact filter of bayesfilter.py
+
+import numpy as np
+
+import bayesfilter
+
+# Moves of the ghost, in the order of bayesfilter.transition_weights
+MOVES = [(0, -1), (0, 1), (1, 0), (-1, 0)]
+
+
+class SparseBeliefStates:
+    """
+    Read-only Z*N*M array of the belief states of supports, as returned by
+    the sparse filter: the dense matrices are only built, once, when the
+    array is used (`np.asarray`, indexing). The game keeps it as it is
+    (see `freezeBeliefStates`), so that a step of the filter does not
+    depend on the size of the maze unless the belief states are displayed
+    or read as matrices.
+    """
+
+    def __init__(self, supports, shape):
+        self.supports = supports
+        self.shape = (len(supports),) + tuple(shape)
+        self.dense = None
+
+    def __array__(self, dtype=None, copy=None):
+        if self.dense is None:
+            self.dense = np.zeros(self.shape)
+            for k, (cells, log_probs) in enumerate(self.supports):
+                self.dense[k].ravel()[cells] = np.exp(log_probs)
+            self.dense.setflags(write=False)
+        array = self.dense if dtype is None else \
+            self.dense.astype(dtype, copy=False)
+        return array.copy() if copy else array
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return np.asarray(self)[index]
+
+    def __iter__(self):
+        return iter(np.asarray(self))
+
+
+class BeliefStateAgent(bayesfilter.BeliefStateAgent):
+    """
+    Exact filter restricted to the support of the belief states: the
+    log-probabilities of the positions whose probability is at least
+    `args.prunethreshold` are kept, and each step only visits them and
+    their neighbours. The belief states are returned as a
+    SparseBeliefStates and their metrics are computed from the supports,
+    so that the cost of a step depends on the size of the uncertainty area
+    rather than on the size of the maze, as long as nothing reads them as
+    N*M matrices (the graphical display does). With a null threshold, the
+    belief states are those of the exact filter.
+    """
+
+    def __init__(self, args):
+        """
+        Arguments:
+        ----------
+        - `args`: Namespace of arguments from command-line prompt.
+        """
+        super().__init__(args)
+
+        # For each ghost, the flat indices of the positions of the support
+        # and their log-probabilities
+        self.supports = None
+        self.threshold = self.args.prunethreshold
+
+        # For each position, which moves lead to a no wall position
+        self.open_moves = None
+
+    def initialize_grid(self):
+        super().initialize_grid()
+        walls = np.array(self.walls.data, dtype=bool)
+        height = walls.shape[1]
+        self.offsets = np.array([di * height + dj for di, dj in MOVES])
+        free = ~walls.ravel()
+        cells = np.flatnonzero(self.inner)
+        self.open_moves = np.zeros((walls.size, len(MOVES)), dtype=bool)
+        self.open_moves[cells] = free[cells[:, None] + self.offsets]
+
+    def update_belief_state(self, evidences, pacman_position):
+        """
+        Given a list of (noised) distances from pacman to ghosts,
+        returns a list of belief states about ghosts positions
+
+        Arguments:
+        ----------
+        - `evidences`: list of distances between
+          pacman and ghosts at state x_{t}
+          where 't' is the current time step
+        - `pacman_position`: 2D coordinates position
+          of pacman at state x_{t}
+          where 't' is the current time step
+
+        Return:
+        -------
+        - A list of Z belief states at state x_{t}
+          as N*M numpy mass probability matrices
+          where N and M are respectively width and height
+          of the maze layout and Z is the number of ghosts,
+          as a SparseBeliefStates.
+
+        N.B. : [0,0] is the bottom left corner of the maze
+        """
+        if self.inner is None:
+            self.initialize_grid()
+        if self.supports is None:
+            self.supports = []
+            for belief in np.asarray(self.beliefGhostStates):
+                cells = np.flatnonzero(belief * self.inner)
+                self.supports.append(
+                    (cells, np.log(belief.ravel()[cells])))
+
+        for k, evidence in enumerate(evidences):
+            cells, log_probs = self.predict_support(
+                self.supports[k], pacman_position)
+            self.supports[k] = self.observe_support(
+                cells, log_probs, evidence, pacman_position)
+
+        beliefStates = SparseBeliefStates(list(self.supports),
+                                          self.inner.shape)
+        self.beliefGhostStates = beliefStates
+        self.counter += 1
+
+        return beliefStates
+
+    def belief_metrics(self, belief_states, ghosts):
+        """
+        Computes the metrics of `bayesfilter.belief_metrics` from the
+        supports of `belief_states`, without expanding them.
+        """
+        width, height = self.inner.shape
+        metrics = {name: [] for name in bayesfilter.METRICS}
+        for (cells, log_probs), (x, y) in zip(belief_states.supports,
+                                              ghosts):
+            if not (0 <= x < width and 0 <= y < height):
+                for values in metrics.values():
+                    values.append(np.nan)
+                continue
+            probs = np.exp(log_probs)
+            i, j = np.divmod(cells, height)
+            # The cells of a support are sorted, as the flat indices of
+            # the dense argmax
+            guess_i, guess_j = divmod(cells[log_probs.argmax()], height)
+            metrics["argmax error"].append(abs(guess_i - x) +
+                                           abs(guess_j - y))
+            metrics["expected error"].append(
+                (probs * (np.abs(i - x) + np.abs(j - y))).sum())
+            metrics["true position probability"].append(
+                probs[cells == x * height + y].sum())
+            metrics["entropy"].append(-(probs * log_probs).sum())
+        return {name: np.array(values, dtype=float)
+                for name, values in metrics.items()}
+
+    def predict_support(self, support, pacman_position):
+        """
+        Transition step on a support: moves the probability mass of its
+        positions to their neighbours.
+
+        Arguments:
+        ----------
+        - 'support': pair of the flat indices of positions and of their
+          log-probabilities
+        - 'pacman_position': 2D coordinates position of pacman
+
+        Return:
+        -------
+        - The support of the predicted belief state, and the logarithms of
+          its (unnormalized) probabilities
+        """
+        cells, log_probs = support
+        c = 1
+        if self.ghost_type == 'afraid':
+            c = 2
+        if self.ghost_type == 'scared':
+            c = 2 ** 3
+
+        # The moves weighted by c are those that do not get closer to pacman
+        i, j = np.divmod(cells, self.inner.shape[1])
+        i_p, j_p = pacman_position
+        away = np.stack([j_p >= j, j_p <= j, i_p <= i, i_p >= i], axis=1)
+        weights = np.where(away, c, 1) * self.open_moves[cells]
+        norm = weights.sum(axis=1)
+
+        # Probabilities relative to the most likely position, so that the
+        # masses do not underflow
+        masses = np.exp(log_probs - log_probs.max())
+        masses[norm == 0] = 0
+        norm[norm == 0] = 1
+        flows = masses[:, None] * weights / norm[:, None]
+
+        moved = weights > 0
+        targets, inverse = np.unique(
+            (cells[:, None] + self.offsets)[moved], return_inverse=True)
+        mass = np.bincount(inverse, weights=flows[moved])
+        return targets, np.log(mass)
+
+    def observe_support(self, cells, log_probs, evidence, pacman_position):
+        """
+        Update step on a support: weights its positions by the sensor model
+        of the exact filter, normalizes and drops the positions whose
+        probability is below the threshold.
+        """
+        width, height = self.inner.shape
+        i, j = np.divmod(cells, height)
+        distances = np.abs(i - pacman_position[0]) + \
+            np.abs(j - pacman_position[1])
+        prob = 1 - np.abs(distances - evidence) / (width + height)
+        prob[prob < 0] = 0.0001
+        prob[~self.inner.ravel()[cells]] = 1
+        with np.errstate(divide='ignore'):
+            log_probs = log_probs + np.log(prob)
+
+        log_probs -= np.logaddexp.reduce(log_probs)
+        kept = log_probs >= np.log(self.threshold) if self.threshold > 0 \
+            else log_probs > -np.inf
+        if not kept.any():
+            kept = log_probs == log_probs.max()
+        cells, log_probs = cells[kept], log_probs[kept]
+        return cells, log_probs - np.logaddexp.reduce(log_probs)
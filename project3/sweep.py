@@ -0,0 +1,249 @@
+import csv
+import io
+import itertools
+import random
+import sys
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+import numpy as np
+
+from bayesfilter import METRICS
+from pacman_module.pacman import runGame
+from run import build_parser, ghosts, load_agent_from_file, \
+    strictly_positive_float, strictly_positive_integer
+
+# Swept parameters, in the order of the results
+SWEPT_FIELDS = ["bsagentfile", "ghostagent", "layout", "sensorvariance"]
+
+# Quantiles of Student's t distribution at 0.975, by degrees of freedom,
+# and of the normal distribution beyond
+T_QUANTILES = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306,
+               2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120,
+               2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064,
+               2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+NORMAL_QUANTILE = 1.960
+
+
+class TrialOver(Exception):
+    """
+    Raised by a `converging` agent to end its game.
+    """
+
+
+def converging(agent_class, tolerance, minsteps, maxsteps):
+    """
+    Returns a subclass of the `BeliefStateAgent` class `agent_class`
+    that ends the game, by raising `TrialOver`, once the 95% confidence
+    interval of its mean argmax error is narrower than `tolerance` on
+    both sides for every ghost, after at least `minsteps` steps, or after
+    `maxsteps` steps.
+    """
+    error = METRICS.index("argmax error")
+
+    class ConvergingAgent(agent_class):
+        def get_action(self, state):
+            action = super().get_action(state)
+            steps = self.metrics.count
+            if steps >= maxsteps or (
+                    steps >= minsteps and
+                    np.nanmax(self.metrics.summary()[2][error]) <=
+                    tolerance):
+                raise TrialOver()
+            return action
+
+    return ConvergingAgent
+
+
+def make_configurations(bsagentfiles, ghostagents, layouts,
+                        sensorvariances, seeds):
+    """
+    Returns a list of dictionaries, one per trial of the grid, mapping
+    the names of the parameters to their values.
+    """
+    return [dict(zip(SWEPT_FIELDS + ["seed"], values))
+            for values in itertools.product(
+                bsagentfiles, ghostagents, layouts, sensorvariances, seeds)]
+
+
+def play_trial(job):
+    """
+    Plays one trial of a sweep in a worker process.
+
+    Arguments:
+    ----------
+    - `job`: the base command-line arguments, the configuration
+      overriding them and the convergence criterion
+      (tolerance, minimum and maximum numbers of steps).
+
+    Return:
+    -------
+    - The configuration, completed with the number of steps played and
+      the mean of each metric of METRICS over the steps and the ghosts
+      (NaN if the game ended before the first step of the agent).
+    """
+    base, configuration, criterion = job
+    args = Namespace(**vars(base))
+    for key, value in configuration.items():
+        setattr(args, key, value)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+
+    agent = load_agent_from_file(args.agentfile, "PacmanAgent")(args)
+    gagts = [ghosts[args.ghostagent](i + 1, args)
+             for i in range(args.nghosts)]
+    bsagt = converging(load_agent_from_file(
+        args.bsagentfile, "BeliefStateAgent"), *criterion)(args)
+
+    with redirect_stdout(io.StringIO()):
+        try:
+            runGame(args.layout, agent, gagts, bsagt, False, expout=0,
+                    hiddenGhosts=args.hiddenghosts,
+                    edibleGhosts=args.edibleghosts)
+        except TrialOver:
+            pass
+
+    result = dict(configuration)
+    if bsagt.metrics is None:
+        result["steps"] = 0
+        result.update((name, np.nan) for name in METRICS)
+        return result
+    result["steps"] = bsagt.metrics.count
+    for name, means in zip(METRICS, bsagt.metrics.summary()[0]):
+        result[name] = np.nanmean(means)
+    return result
+
+
+def run_sweep(base, configurations, criterion, processes=None):
+    """
+    Plays all the trials of `configurations` in a pool of `processes`
+    worker processes (one per core by default), and returns their
+    results in the order of `configurations`.
+    """
+    base = Namespace(**vars(base))
+    base.silentdisplay = True
+    base.metricsfile = None
+    base.metricsflush = sys.maxsize
+
+    jobs = [(base, configuration, criterion)
+            for configuration in configurations]
+    with Pool(processes) as pool:
+        return list(pool.imap(play_trial, jobs, chunksize=1))
+
+
+def aggregate(results):
+    """
+    Groups the trials of `results` that only differ by their seed.
+
+    Return:
+    -------
+    - A list of dictionaries, one per group: the swept parameters, the
+      number of trials and, for each metric of METRICS, the mean over the
+      trials and the half-width of its 95% confidence interval (Student's
+      t, normal beyond 30 degrees of freedom, NaN for a single trial).
+    """
+    groups = {}
+    for result in results:
+        key = tuple(result[field] for field in SWEPT_FIELDS)
+        groups.setdefault(key, []).append(result)
+
+    rows = []
+    for key, trials in groups.items():
+        row = dict(zip(SWEPT_FIELDS, key))
+        row["trials"] = n = len(trials)
+        for name in METRICS:
+            values = np.array([trial[name] for trial in trials])
+            row[name] = values.mean()
+            if n > 1:
+                t = T_QUANTILES[n - 2] if n - 1 <= len(T_QUANTILES) \
+                    else NORMAL_QUANTILE
+                row[name + " ci95"] = t * values.std(ddof=1) / np.sqrt(n)
+            else:
+                row[name + " ci95"] = np.nan
+        rows.append(row)
+    return rows
+
+
+def write_rows(rows, f):
+    if not rows:
+        return
+    writer = csv.DictWriter(f, fieldnames=list(rows[0]), delimiter=';')
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python sweep.py <sweep_options> <game_options>
+    EXAMPLES:   (1) python sweep.py --ghostagents confused afraid scared
+                        --layouts large_filter large_filter_walls
+                        --sensorvariances 0.5 1 2 --seeds 1 2 3
+                    - runs the 54 trials of the grid on all cores and
+                      prints the metrics of each combination, with their
+                      confidence intervals over the seeds
+
+    Game options are those of run.py and are shared by all trials.
+    """
+
+    parser = ArgumentParser(usage)
+    parser.add_argument(
+        '--bsagentfiles',
+        help='Python files containing a `BeliefStateAgent` class.',
+        nargs='+', default=["bayesfilter.py"])
+    parser.add_argument(
+        '--ghostagents',
+        help='Ghost agents available in the `ghostAgents` module.',
+        nargs='+', choices=sorted(ghosts), default=["confused"])
+    parser.add_argument(
+        '--layouts',
+        help='Maze layouts (from layout folder).',
+        nargs='+', default=["large_filter"])
+    parser.add_argument(
+        '--sensorvariances',
+        help='Variances of the sensor noise.',
+        nargs='+', type=strictly_positive_float, default=[1.0])
+    parser.add_argument(
+        '--seeds',
+        help='Seeds for the random number generators, one trial per seed.',
+        nargs='+', type=int, default=[1, 2, 3])
+    parser.add_argument(
+        '--tolerance',
+        help='Half-width of the 95% confidence interval of the mean '
+             'argmax error at which a trial stops.',
+        type=strictly_positive_float, default=0.1)
+    parser.add_argument(
+        '--minsteps',
+        help='Minimum number of steps of a trial.',
+        type=strictly_positive_integer, default=100)
+    parser.add_argument(
+        '--maxsteps',
+        help='Maximum number of steps of a trial.',
+        type=strictly_positive_integer, default=10000)
+    parser.add_argument(
+        '--processes',
+        help='Number of worker processes (default: number of cores).',
+        type=int, default=None)
+    parser.add_argument(
+        '--output',
+        help='CSV file receiving the results of every trial.',
+        default=None)
+
+    args, game_argv = parser.parse_known_args()
+    base = build_parser().parse_args(game_argv)
+    # The human agent cannot play without graphical display
+    if base.agentfile == "humanagent.py":
+        base.agentfile = "pacmanagent.py"
+
+    configurations = make_configurations(
+        args.bsagentfiles, args.ghostagents, args.layouts,
+        args.sensorvariances, args.seeds)
+    results = run_sweep(base, configurations,
+                        (args.tolerance, args.minsteps, args.maxsteps),
+                        args.processes)
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            write_rows(results, f)
+    write_rows(aggregate(results), sys.stdout)
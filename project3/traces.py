@@ -0,0 +1,198 @@
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from bayesfilter import METRICS, belief_metrics
+from pacman_module.layout import Layout, getLayout
+from pacman_module.vectorGames import VectorizedGames, \
+    randomPacmanPolicy, stopPacmanPolicy
+from run import build_parser, load_agent_from_file, \
+    strictly_positive_integer
+
+pacman_policies = {}
+pacman_policies["random"] = randomPacmanPolicy
+pacman_policies["stop"] = stopPacmanPolicy
+
+
+def record_traces(layout, ngames, steps, ghostagent, nghosts,
+                  sensorvariance, pacman="random", seed=None):
+    """
+    Plays `ngames` games with the belief tracking rules and records what a
+    `BeliefStateAgent` observes after each round.
+
+    Arguments:
+    ----------
+    - `layout`: the `Layout` of the games.
+    - `steps`: maximum number of rounds per game.
+    - `ghostagent`: ghost policy, from `vectorGames.GHOST_POLICIES`.
+    - `sensorvariance`: variance of the Gaussian noise of the evidence,
+      as in `BeliefStateAgent._get_evidence`.
+    - `pacman`: Pacman's policy, from `pacman_policies`.
+
+    Return:
+    -------
+    - A dictionary of arrays, where G, T and Z are the numbers of games,
+      of steps and of ghosts:
+      `pacman` (G*T*2) and `ghosts` (G*T*Z*2) positions,
+      `evidences` (G*T*Z) noisy distances,
+      `lengths` (G) numbers of steps played by each game,
+      and the settings of the recording.
+    """
+    games = VectorizedGames(layout, ngames, ghostagent, nghosts,
+                            pacman_policies[pacman], beliefTracking=True,
+                            seed=seed)
+    rng = np.random.default_rng(seed)
+    nghosts = games.numGhosts
+    positions = np.zeros((ngames, steps, nghosts + 1, 2), dtype=np.int16)
+    evidences = np.zeros((ngames, steps, nghosts))
+    lengths = np.zeros(ngames, dtype=int)
+
+    for t in range(steps):
+        playing = ~games.isOver()
+        if not playing.any():
+            break
+        games.step()
+        # A game lost during this round ends without a last observation
+        playing &= ~games.isOver()
+        positions[playing, t, :, 0] = games.x[playing]
+        positions[playing, t, :, 1] = games.y[playing]
+        distances = np.abs(games.x[:, 1:] - games.x[:, :1]) + \
+            np.abs(games.y[:, 1:] - games.y[:, :1])
+        evidences[playing, t] = rng.normal(
+            loc=distances[playing], scale=np.sqrt(sensorvariance))
+        lengths[playing] += 1
+
+    return dict(layout=np.array(layout.layoutText),
+                pacman=positions[:, :, 0], ghosts=positions[:, :, 1:],
+                evidences=evidences, lengths=lengths,
+                ghostagent=np.array(ghostagent),
+                sensorvariance=np.array(sensorvariance))
+
+
+def save_traces(path, traces):
+    np.savez_compressed(path, **traces)
+
+
+def load_traces(path):
+    with np.load(path) as f:
+        return {key: f[key] for key in f.files}
+
+
+def evaluate_traces(agent_class, traces, args):
+    """
+    Feeds each recorded game to a new agent and computes, after each
+    update, the error metrics of its belief states.
+
+    Arguments:
+    ----------
+    - `agent_class`: the `BeliefStateAgent` class to evaluate.
+    - `traces`: the recording, see `record_traces`.
+    - `args`: command-line arguments of `run.py` given to the agents.
+
+    Return:
+    -------
+    - A dictionary mapping each name of METRICS to a G*T*Z array, whose
+      values after the end of a game are NaN, and the total time spent
+      in `update_belief_state`.
+    """
+    layout = Layout(list(traces["layout"]))
+    pacman, ghosts = traces["pacman"], traces["ghosts"]
+    ngames, steps, nghosts = traces["evidences"].shape
+    width, height = layout.width, layout.height
+
+    metrics = {name: np.full((ngames, steps, nghosts), np.nan)
+               for name in METRICS}
+    seconds = 0.
+    for g in range(ngames):
+        agent = agent_class(args)
+        agent.walls = layout.walls
+        agent.beliefGhostStates = np.full(
+            (nghosts, width, height), 1.0 / (width * height))
+        for t in range(traces["lengths"][g]):
+            start = time.time()
+            beliefStates = np.asarray(agent.update_belief_state(
+                list(traces["evidences"][g, t]), tuple(pacman[g, t])))
+            seconds += time.time() - start
+
+            for name, values in belief_metrics(
+                    beliefStates, ghosts[g, t]).items():
+                metrics[name][g, t] = values
+
+    return metrics, seconds
+
+
+def evaluate_agent(agent_class, traces, args):
+    """
+    Returns the mean of each metric of `evaluate_traces` over all the
+    updates, and the mean time of an update.
+    """
+    metrics, seconds = evaluate_traces(agent_class, traces, args)
+    means = [np.nanmean(metrics[name]) for name in METRICS]
+    return means, seconds / max(traces["lengths"].sum(), 1)
+
+
+if __name__ == '__main__':
+    usage = """
+    USAGE:      python traces.py --record <file> <options> <agent_options>
+                python traces.py --evaluate <file> <options> <agent_options>
+    EXAMPLES:   (1) python traces.py --record scared.npz --ghostagent scared
+                    - records 10 games of 100 steps with scared ghosts
+                (2) python traces.py --evaluate scared.npz
+                        --bsagentfiles bayesfilter.py particlefilter.py
+                    - compares both filters on the recorded games
+    """
+
+    parser = ArgumentParser(usage)
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument(
+        '--record',
+        help='File receiving the recorded games.')
+    action.add_argument(
+        '--evaluate',
+        help='File of recorded games to evaluate the filters on.')
+    parser.add_argument(
+        '--bsagentfiles',
+        help='Python files containing a `BeliefStateAgent` class.',
+        nargs='+', default=["bayesfilter.py"])
+    parser.add_argument(
+        '--games',
+        help='Number of games recorded.',
+        type=strictly_positive_integer, default=10)
+    parser.add_argument(
+        '--steps',
+        help='Maximum number of steps recorded per game.',
+        type=strictly_positive_integer, default=100)
+    parser.add_argument(
+        '--pacman',
+        help='Policy of Pacman in recorded games.',
+        choices=sorted(pacman_policies), default="random")
+
+    args, game_argv = parser.parse_known_args()
+    # Layout, ghosts, sensor and filters are set by the options of run.py
+    game_args = build_parser().parse_args(game_argv)
+    seed = None if game_args.seed == -1 else game_args.seed
+
+    if args.record is not None:
+        layout = getLayout(game_args.layout)
+        if layout is None:
+            sys.exit("Layout " + game_args.layout + " not found")
+        traces = record_traces(layout, args.games, args.steps,
+                               game_args.ghostagent, game_args.nghosts,
+                               game_args.sensorvariance, args.pacman, seed)
+        save_traces(args.record, traces)
+        print("%d steps recorded in %s" % (traces["lengths"].sum(),
+                                            args.record))
+    else:
+        traces = load_traces(args.evaluate)
+        # The filters model the ghosts of the recording
+        game_args.ghostagent = str(traces["ghostagent"])
+        game_args.sensorvariance = float(traces["sensorvariance"])
+        print("agent;" + ";".join(METRICS) + ";seconds per update")
+        for agentfile in args.bsagentfiles:
+            np.random.seed(seed)
+            agent_class = load_agent_from_file(agentfile, "BeliefStateAgent")
+            means, seconds = evaluate_agent(agent_class, traces, game_args)
+            print(agentfile + "".join(";%.4f" % m for m in means) +
+                  ";%.6f" % seconds)